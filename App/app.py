@@ -1,4 +1,5 @@
 # from App import app
+import os
 from flask import Flask, Blueprint
 import views   
 
@@ -8,6 +9,11 @@ for obj in vars(views).values():
         if isinstance(obj, Blueprint):
             app.register_blueprint(obj, url_prefix='/')
 
+# With gunicorn --preload the pages are rendered once, before the workers are forked, and shared by all of them
+if os.getenv('PRERENDER_PAGES'):
+    with app.test_request_context('/'):
+        views.prerender_pages()
+
 
 
 if __name__ == "__main__":
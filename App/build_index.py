@@ -0,0 +1,113 @@
+"""Builds the App's recommendation index offline, for many subjects at once
+
+The subjects are every title of clusters.json, the center titles of cluster_centers.json, or the keys or items of
+a json file, such as answer_dict.json. They are split into chunks recommended in parallel by a pool of processes,
+each of which loads the Recommender once (its vectors are memory-mapped, so the processes share them) and recommends
+a whole chunk with one matrix product. The results, merged with the recommendations of answer_dict.json unless told
+otherwise, are written to the index that views.py serves.
+
+Usage: python build_index.py [--subjects titles|centers|FILE] [--out recommendations.db] [--processes N]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+from index import build_index
+from recommender import load_recommender
+
+_recommender = None
+
+def _init_worker(directory):
+    global _recommender
+    _recommender = load_recommender(directory)
+
+def _recommend_chunk(args):
+    subjects, n = args
+    return subjects, _recommender.recommend_many(subjects, n)
+
+def load_subjects(source, directory='.'):
+    """Returns the list of subjects named by source: 'titles', 'centers', or the path of a json list or dictionary"""
+    if source == 'titles':
+        with open(os.path.join(directory, 'clusters.json')) as json_file:
+            clusters = json.load(json_file)
+        return list(dict.fromkeys(title for titles in clusters.values() for title in titles))
+    if source == 'centers':
+        with open(os.path.join(directory, 'cluster_centers.json')) as json_file:
+            cluster_centers = json.load(json_file)
+        return list(dict.fromkeys(center[0] for center in cluster_centers.values()))
+    with open(source) as json_file:
+        return list(json.load(json_file))
+
+def recommend_all(subjects, directory='.', n=10, processes=None, chunk_size=1000):
+    """Recommends n pages for each of subjects, in parallel
+
+    Parameters
+    ---------------
+    subjects : List
+        The subjects to recommend pages for
+    directory : str
+        The directory holding the files load_recommender needs
+    n : int
+        The number of pages to recommend for each subject
+    processes : int or None
+        The number of processes of the pool; defaults to the number of cpus, and 1 recommends in this process
+    chunk_size : int
+        The number of subjects each task recommends with one matrix product
+
+    Returns
+    ---------------
+    subject_dict : Dict
+        A dictionary like answer_dict.json, from each subject any of whose words has a vector to its recommendations
+    """
+    chunks = [(subjects[i:i + chunk_size], n) for i in range(0, len(subjects), chunk_size)]
+    subject_dict = dict()
+    if processes == 1:
+        _init_worker(directory)
+        results = map(_recommend_chunk, chunks)
+    else:
+        pool = Pool(processes, initializer=_init_worker, initargs=(directory,))
+        results = pool.imap_unordered(_recommend_chunk, chunks)
+    for chunk, recommendations in results:
+        for subject, top_ten in zip(chunk, recommendations):
+            if top_ten:
+                subject_dict[subject] = top_ten
+    if processes != 1:
+        pool.close()
+        pool.join()
+    return subject_dict
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the recommendation index for many subjects at once')
+    parser.add_argument('--subjects', default='titles',
+                        help="'titles' for every clustered title, 'centers' for the cluster centers, or a json file")
+    parser.add_argument('--data', default='.', help='the directory of the recommender files')
+    parser.add_argument('--out', default=os.getenv('INDEX_PATH', 'recommendations.db'), help='the index to write')
+    parser.add_argument('--json', help='also write the recommendations to this json file, like answer_dict.json')
+    parser.add_argument('--merge', default='answer_dict.json',
+                        help="a json file of recommendations to keep, which take precedence; '' for none")
+    parser.add_argument('-n', type=int, default=10, help='the number of pages to recommend for each subject')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if load_recommender(args.data) is None:
+        sys.exit('The recommender files are missing from %s' % args.data)
+    subjects = load_subjects(args.subjects, args.data)
+    start = time.time()
+    subject_dict = recommend_all(subjects, args.data, args.n, args.processes, args.chunk_size)
+    print('Recommended pages for %d of %d subjects in %.1f s'
+          % (len(subject_dict), len(subjects), time.time() - start), file=sys.stderr)
+    if args.merge and os.path.exists(args.merge):
+        with open(args.merge) as json_file:
+            subject_dict.update(json.load(json_file))
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(subject_dict, json_file)
+    build_index(subject_dict, args.out, 'batch')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = """
+CREATE TABLE subjects (
+    subject TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TABLE recommendations (
+    subject TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    link TEXT NOT NULL,
+    PRIMARY KEY (subject, rank)
+) WITHOUT ROWID;
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def build_index(subject_dict, path, source='json'):
+    """Writes the recommendations to a SQLite index at path, replacing any index already there
+
+    The index is written to a temporary file first and moved into place, so workers that already have the old
+    index open keep reading it undisturbed.
+
+    Parameters
+    ---------------
+    subject_dict : Dict
+        A dictionary like answer_dict.json, keyed by subjects and valued with lists of [title, link] pairs
+    path : str
+        The path of the index
+    source : str
+        Where the recommendations come from, recorded in the index: 'json' when it is built from answer_dict.json
+        alone, which views.py rebuilds whenever that file changes, or 'batch' when build_index.py builds it
+
+    Returns
+    ---------------
+    version : str
+        A digest of the contents of the index, which changes whenever the recommendations do
+    """
+    version = hashlib.sha256(json.dumps(subject_dict, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.executemany('INSERT INTO subjects (subject) VALUES (?)', ((subject,) for subject in subject_dict))
+            conn.executemany('INSERT INTO recommendations (subject, rank, title, link) VALUES (?, ?, ?, ?)',
+                             ((subject, rank, title, link) for subject in subject_dict
+                              for rank, (title, link) in enumerate(subject_dict[subject])))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('version', ?)", (version,))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('source', ?)", (source,))
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return version
+
+def build_index_from_json(json_path, path):
+    """Builds the index at path from a json file like answer_dict.json"""
+    with open(json_path) as json_file:
+        subject_dict = json.load(json_file)
+    return build_index(subject_dict, path, 'json')
+
+
+class RecommendationIndex:
+    """Read-only access to an index written by build_index
+
+    Connections are opened lazily, one per thread of each process, so the index can be created before gunicorn forks
+    its workers without any of them sharing a SQLite connection. The database is opened immutable and memory-mapped,
+    so the workers all read the same pages of the file from the page cache instead of each holding a copy.
+
+    Parameters
+    ---------------
+    path : str
+        The path of the index
+    mmap_size : int
+        The number of bytes of the file SQLite may memory-map
+    """
+
+    def __init__(self, path, mmap_size=2**28):
+        self.path = os.path.abspath(path)
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._subjects = None
+        self._version = None
+
+    @property
+    def conn(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect('file:%s?mode=ro&immutable=1' % self.path, uri=True,
+                                         check_same_thread=False)
+            local.conn.execute('PRAGMA mmap_size = %d' % self.mmap_size)
+            local.pid = os.getpid()
+        return local.conn
+
+    def __contains__(self, subject):
+        return self.conn.execute('SELECT 1 FROM subjects WHERE subject = ?', (subject,)).fetchone() is not None
+
+    def __len__(self):
+        return len(self.subjects())
+
+    def subjects(self):
+        """Returns the sorted list of all subjects"""
+        if self._subjects is None:
+            self._subjects = [row[0] for row in self.conn.execute('SELECT subject FROM subjects ORDER BY subject')]
+        return self._subjects
+
+    def version(self):
+        """Returns the digest of the recommendations the index was built from"""
+        if self._version is None:
+            self._version = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        return self._version
+
+    def source(self):
+        """Returns where the recommendations come from, as given to build_index, or None for an index written before
+        it was recorded"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row[0] if row else None
+
+    def recommendations(self, subject):
+        """Returns the list of (title, link) pairs recommended for subject, or None if subject is not in the index"""
+        rows = self.conn.execute('SELECT title, link FROM recommendations WHERE subject = ? ORDER BY rank',
+                                 (subject,)).fetchall()
+        if not rows and subject not in self:
+            return None
+        return rows
+
+    def recommendations_many(self, subjects, chunk_size=500):
+        """Returns a dictionary from each of subjects in the index to its list of (title, link) pairs, with one query
+        per chunk of subjects"""
+        results = dict()
+        subjects = list(dict.fromkeys(subjects))
+        for start in range(0, len(subjects), chunk_size):
+            chunk = subjects[start:start + chunk_size]
+            marks = ', '.join('?' * len(chunk))
+            for (subject,) in self.conn.execute('SELECT subject FROM subjects WHERE subject IN (%s)' % marks, chunk):
+                results[subject] = []
+            for subject, title, link in self.conn.execute('SELECT subject, title, link FROM recommendations '
+                                                          'WHERE subject IN (%s) ORDER BY subject, rank' % marks, chunk):
+                results[subject].append((title, link))
+        return results
@@ -0,0 +1,146 @@
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+JOB_PREFIX = 'recommend-'
+CACHE_PREFIX = 'recommend:'
+LOCK_PREFIX = 'recommend-lock:'
+
+def normalize(subject):
+    """Lowercases subject and collapses its whitespace, so that the same query typed differently shares a result"""
+    return ' '.join(subject.casefold().split())
+
+def query_key(subject):
+    """Returns the key of the query for subject, used both for its cached result and for the id of its job"""
+    return hashlib.sha1(normalize(subject).encode('utf-8')).hexdigest()[:20]
+
+def job_id(subject):
+    return JOB_PREFIX + query_key(subject)
+
+
+class LRUCache:
+    """A small in-process cache with a time-to-live, evicting the least recently used entries beyond maxsize"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class ResultCache:
+    """The cache of live recommendations, shared by the web and worker processes through redis
+
+    Results expire after ttl seconds; with redis configured with an allkeys-lru maxmemory policy the least recently
+    used results are also evicted first under memory pressure. Without a redis connection the results are kept in an
+    in-process LRUCache instead, which is enough for a single process.
+
+    Parameters
+    ---------------
+    conn : redis.Redis or None
+        The connection to redis, or None to cache in-process
+    ttl : int
+        The number of seconds a result is kept
+    maxsize : int
+        The number of results the in-process cache keeps at most
+    """
+
+    def __init__(self, conn=None, ttl=86400, maxsize=1024):
+        self.conn = conn
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl) if conn is None else None
+
+    def get(self, subject):
+        """Returns the cached list of [title, link] pairs for subject, or None if it is not cached"""
+        return self.lookup(query_key(subject))
+
+    def lookup(self, key):
+        """Returns the cached result of the query with query_key key, or None if it is not cached"""
+        key = CACHE_PREFIX + key
+        if self.local is not None:
+            return self.local.get(key)
+        value = self.conn.get(key)
+        return None if value is None else json.loads(value)
+
+    def get_many(self, subjects):
+        """Returns a dictionary from each of subjects that is cached to its result, with one round trip to redis"""
+        if not subjects:
+            return dict()
+        if self.local is not None:
+            values = [self.local.get(CACHE_PREFIX + query_key(subject)) for subject in subjects]
+        else:
+            values = [None if value is None else json.loads(value)
+                      for value in self.conn.mget([CACHE_PREFIX + query_key(subject) for subject in subjects])]
+        return {subject: value for subject, value in zip(subjects, values) if value is not None}
+
+    def set(self, subject, recommendations):
+        key = CACHE_PREFIX + query_key(subject)
+        if self.local is not None:
+            self.local.set(key, recommendations)
+        else:
+            self.conn.set(key, json.dumps(recommendations), ex=self.ttl)
+
+
+def enqueue_recommendation(queue, subject, job_timeout=60, result_ttl=600):
+    """Enqueues the live recommendation of subject, unless a job for the same query is already queued or running
+
+    Concurrent requests for the same query race for a lock named after its job id, and only the winner enqueues.
+
+    Parameters
+    ---------------
+    queue : rq.Queue
+        The queue the worker listens on
+    subject : str
+        The subject to recommend pages for
+
+    Returns
+    ---------------
+    job_id : str
+        The id of the job computing the recommendations, job_id(subject)
+    """
+    from rq.job import Job
+    from rq.exceptions import NoSuchJobError
+
+    key = job_id(subject)
+    try:
+        if Job.fetch(key, connection=queue.connection).get_status() not in ('finished', 'failed', 'stopped', 'canceled'):
+            return key
+    except NoSuchJobError:
+        pass
+    if queue.connection.set(LOCK_PREFIX + key, 1, nx=True, ex=job_timeout):
+        queue.enqueue('tasks.recommend', subject, job_id=key, job_timeout=job_timeout,
+                      result_ttl=result_ttl, failure_ttl=result_ttl)
+    return key
+
+def job_status(queue, key):
+    """Returns the status of the job with id key: one of rq's job statuses, or None if there is no such job"""
+    from rq.job import Job
+    from rq.exceptions import NoSuchJobError
+
+    try:
+        status = Job.fetch(key, connection=queue.connection).get_status()
+        return getattr(status, 'value', status)
+    except NoSuchJobError:
+        # Between the lock being taken and the job being saved, the job is as good as queued
+        return 'queued' if queue.connection.exists(LOCK_PREFIX + key) else None
@@ -0,0 +1,107 @@
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for name, value in zip(names, values))
+
+def _number(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Metric:
+    """A metric in the Prometheus text format, with one series per combination of the values of its labels
+
+    The values are those of this process: under gunicorn each worker exposes its own, which Prometheus tells apart by
+    the instance it scrapes, or which can be summed across workers by the query.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._series = dict()
+        self._lock = threading.Lock()
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            for values, value in sorted(self._series.items()):
+                lines.extend(self._samples(values, value))
+        return lines
+
+    def _samples(self, values, value):
+        return ['%s%s %s' % (self.name, _labels(self.label_names, values), _number(value))]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(Metric):
+    """Counts observations in cumulative buckets, as Prometheus histograms do, with their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self, values, series):
+        names = self.label_names + ('le',)
+        lines = ['%s_bucket%s %d' % (self.name, _labels(names, values + (_number(bound),)), count)
+                 for bound, count in zip(self.buckets, series[0])]
+        lines.append('%s_bucket%s %d' % (self.name, _labels(names, values + ('+Inf',)), series[2]))
+        lines.append('%s_sum%s %s' % (self.name, _labels(self.label_names, values), _number(series[1])))
+        lines.append('%s_count%s %d' % (self.name, _labels(self.label_names, values), series[2]))
+        return lines
+
+
+class Registry:
+    """The metrics exposed by the /metrics route"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, documentation, labels, buckets))
+
+    def expose(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.expose()) + '\n'
@@ -0,0 +1,60 @@
+import os
+import gzip
+import hashlib
+
+from jobs import LRUCache
+
+def template_digest(names, folder='templates'):
+    """Returns a digest of the templates a page is rendered from, so that cached pages change with them"""
+    digest = hashlib.sha256()
+    for name in names:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), folder, name), 'rb') as template:
+            digest.update(template.read())
+    return digest.hexdigest()[:16]
+
+
+class PageCache:
+    """Results pages rendered once and kept gzip-compressed, for the subjects of the recommendation index
+
+    A results page only depends on the recommendations of its subject and on the templates, so a page is valid for as
+    long as both are unchanged: its ETag is made of the version of the index, the digest of the templates and a hash
+    of the subject, and a request whose If-None-Match carries it is answered 304 without reading the index or the
+    cache. The pages are kept in an LRUCache that never expires them; with prerender called before gunicorn forks its
+    workers, they all share the same pages.
+
+    Parameters
+    ---------------
+    version : str
+        The version of the index, with that of the templates
+    maxsize : int
+        The number of pages kept
+    max_age : int
+        The number of seconds browsers may reuse a page before asking whether it has changed
+    """
+
+    def __init__(self, version, maxsize=10000, max_age=300):
+        self.version = version
+        self.maxsize = maxsize
+        self.cache_control = 'public, max-age=%d' % max_age
+        self._pages = LRUCache(maxsize, ttl=float('inf'))
+
+    def etag(self, subject):
+        """Returns the ETag of the page of subject, unquoted; it is sent weak, as the same page is sent both
+        compressed and not"""
+        return '%s-%s' % (self.version, hashlib.sha1(subject.encode('utf-8')).hexdigest()[:16])
+
+    def get(self, subject):
+        """Returns the compressed page of subject, or None if it has not been rendered yet"""
+        return self._pages.get(subject)
+
+    def set(self, subject, html):
+        body = gzip.compress(html.encode('utf-8'), compresslevel=9, mtime=0)
+        self._pages.set(subject, body)
+        return body
+
+    def prerender(self, subjects, render):
+        """Renders the pages of subjects, up to maxsize of them, with render(subject), which returns the html of a
+        page"""
+        for subject in subjects[:self.maxsize]:
+            self.set(subject, render(subject))
+        return min(len(subjects), self.maxsize)
@@ -0,0 +1,204 @@
+import os
+import json
+import numpy as np
+import scipy.sparse
+from urllib.parse import quote
+
+WIKI_LINK = 'en.wikipedia.org/wiki/'
+
+def wiki_link(title):
+    """Returns the link to the Wikipedia page of title, in the form of the links in answer_dict.json"""
+    return WIKI_LINK + quote(title.replace(' ', '_'), safe="/(),:!*")
+
+def load_embeddings(directory):
+    """Loads the word vectors exported by Embeddings.py, memory-mapped; returns the word index and the vectors"""
+    with open(os.path.join(directory, 'vocab.json')) as json_file:
+        words = json.load(json_file)
+    vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+    return {word: i for i, word in enumerate(words)}, vectors
+
+def load_cluster_names(path, num_clusters):
+    """Loads the cluster name vectors of get_cluster_names, saved as json or as a .npy array with one row per cluster"""
+    if path.endswith('.npy'):
+        return np.load(path)
+    with open(path) as json_file:
+        cluster_names = json.load(json_file)
+    names = None
+    for i, vector in cluster_names.items():
+        if names is None:
+            names = np.zeros((num_clusters, len(vector)), dtype=np.float32)
+        names[int(i)] = vector
+    return names
+
+def cluster_graph_from_dict(community_graph_dict, num_clusters):
+    """Builds the weighted adjacency matrix of the cluster multigraph from a dict like community_graph_dict.json"""
+    rows = np.fromiter((int(i) for i in community_graph_dict for j in community_graph_dict[i]), dtype=np.int64)
+    cols = np.fromiter((int(j) for i in community_graph_dict for j in community_graph_dict[i]), dtype=np.int64)
+    A = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_clusters, num_clusters))
+    A.sum_duplicates()
+    return A
+
+
+class Recommender:
+    """Recommends Wikipedia pages for any free-text subject, not only those of answer_dict.json
+
+    The subject is embedded as the mean of the word vectors of its words, and compared by cosine similarity with the
+    cluster name vectors of get_cluster_names, all at once, to find the clusters nearest to it. From there the
+    community graph is walked greedily: the next cluster is always the unvisited one with the most edges into those
+    visited so far. The recommendations are the centers of the clusters, in the order they were visited.
+
+    Parameters
+    ---------------
+    word_index : Dict
+        A dictionary from words to rows of vectors
+    vectors : Array
+        The word vectors, one row per word
+    cluster_names : Array
+        The name vector of each cluster, one row per cluster
+    cluster_centers : Dict
+        A dictionary like cluster_centers.json, keyed by cluster labels and valued with (title, categories) pairs
+    cluster_graph : scipy.sparse.csr_matrix
+        The weighted adjacency matrix of the cluster multigraph
+    title_link : Dict or None
+        A dictionary like titlelink.json, from titles to the urls they were crawled from; links are built from the
+        titles otherwise
+    """
+
+    def __init__(self, word_index, vectors, cluster_names, cluster_centers, cluster_graph, title_link=None):
+        self.word_index = word_index
+        self.vectors = vectors
+        norms = np.linalg.norm(cluster_names, axis=1, keepdims=True)
+        self.cluster_names = (cluster_names / np.where(norms > 0, norms, 1)).astype(np.float32)
+        self.centers = [None] * len(cluster_names)
+        for i, center in cluster_centers.items():
+            self.centers[int(i)] = center[0]
+        # Self-loops would only keep the walk where it is
+        cluster_graph = scipy.sparse.csr_matrix(cluster_graph)
+        self.cluster_graph = (cluster_graph - scipy.sparse.diags(cluster_graph.diagonal())).tocsr()
+        self.cluster_graph.eliminate_zeros()
+        self.title_link = title_link or dict()
+        self._links = dict()
+
+    def embed(self, subject):
+        """Returns the mean word vector of the words of subject, or None if none of them has a vector"""
+        rows = [self.word_index[word] for word in subject.lower().split() if word in self.word_index]
+        if not rows:
+            return None
+        return np.asarray(self.vectors[rows], dtype=np.float32).mean(axis=0)
+
+    def embed_many(self, subjects):
+        """Returns the mean word vectors of many subjects as the rows of one array, all computed with a single sparse
+        product, and a mask of the subjects that had any word with a vector"""
+        rows, cols = [], []
+        for i, subject in enumerate(subjects):
+            words = [self.word_index[word] for word in subject.lower().split() if word in self.word_index]
+            rows.extend([i] * len(words))
+            cols.extend(words)
+        counts = np.bincount(rows, minlength=len(subjects)).astype(np.float32)
+        weights = 1 / counts[rows] if rows else np.zeros(0, dtype=np.float32)
+        mean = scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(len(subjects), len(self.vectors)))
+        return np.asarray(mean @ self.vectors, dtype=np.float32), counts > 0
+
+    def nearest_clusters(self, vector, n=1):
+        """Returns the n clusters whose names are most similar to vector, most similar first"""
+        similarity = self.cluster_names @ (vector / (np.linalg.norm(vector) or 1))
+        n = min(n, len(similarity))
+        nearest = np.argpartition(-similarity, n - 1)[:n]
+        return nearest[np.argsort(-similarity[nearest], kind='stable')], similarity
+
+    def walk(self, start, similarity, n=10):
+        """Returns up to n clusters, starting from start and growing along the heaviest edges of the cluster graph
+
+        When the clusters visited so far have no edges to any other, the walk jumps to the most similar unvisited
+        cluster instead.
+        """
+        return self._walk(start, similarity, n)[0]
+
+    def _walk(self, start, similarity, n):
+        """The walk, and whether it had to jump; only walks that jumped depend on similarity"""
+        visited = [int(start)]
+        jumped = False
+        weight = np.zeros(self.cluster_graph.shape[0])
+        unvisited = np.ones(self.cluster_graph.shape[0], dtype=bool)
+        unvisited[start] = False
+        indptr, indices, data = self.cluster_graph.indptr, self.cluster_graph.indices, self.cluster_graph.data
+        while len(visited) < min(n, len(weight)):
+            row = slice(indptr[visited[-1]], indptr[visited[-1] + 1])
+            weight[indices[row]] += data[row]
+            candidates = np.where(unvisited, weight, -np.inf)
+            step = int(np.argmax(candidates))
+            if candidates[step] <= 0:
+                step = int(np.argmax(np.where(unvisited, similarity, -np.inf)))
+                jumped = True
+            visited.append(step)
+            unvisited[step] = False
+        return visited, jumped
+
+    def recommend(self, subject, n=10):
+        """Returns up to n [title, link] pairs for subject, like the values of answer_dict.json, or None if no word of
+        subject has a vector"""
+        vector = self.embed(subject)
+        if vector is None:
+            return None
+        nearest, similarity = self.nearest_clusters(vector)
+        titles = [self.centers[i] for i in self.walk(nearest[0], similarity, n) if self.centers[i] is not None]
+        return [[title, self.link(title)] for title in titles]
+
+    def recommend_many(self, subjects, n=10):
+        """Returns the output of recommend for each of many subjects, with one matrix product for all similarities"""
+        vectors, known = self.embed_many(subjects)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = (vectors / np.where(norms > 0, norms, 1)) @ self.cluster_names.T
+        nearest = np.argmax(similarity, axis=1)
+
+        # Most subjects share their nearest cluster with others, and walks that never jump only depend on it
+        walks = dict()
+        results = []
+        for i in range(len(subjects)):
+            if not known[i]:
+                results.append(None)
+            elif nearest[i] in walks:
+                results.append(walks[nearest[i]])
+            else:
+                visited, jumped = self._walk(nearest[i], similarity[i], n)
+                titles = [self.centers[j] for j in visited if self.centers[j] is not None]
+                results.append([[title, self.link(title)] for title in titles])
+                if not jumped:
+                    walks[nearest[i]] = results[-1]
+        return results
+
+    def link(self, title):
+        """Returns the link of title without its scheme, as the results template expects"""
+        if title not in self._links:
+            if title in self.title_link:
+                self._links[title] = self.title_link[title].split('://', 1)[-1]
+            else:
+                self._links[title] = wiki_link(title)
+        return self._links[title]
+
+
+def load_recommender(directory='.'):
+    """Loads a Recommender from the files in directory, or returns None if any of them is missing
+
+    The files are the word vector subset exported by Embeddings.py in embeddings/, cluster_names.npy or
+    cluster_names.json, cluster_centers.json, community_graph_dict.json, and optionally titlelink.json.
+    """
+    path = lambda name: os.path.join(directory, name)
+    names_path = path('cluster_names.npy') if os.path.exists(path('cluster_names.npy')) else path('cluster_names.json')
+    required = [path('embeddings/vocab.json'), names_path, path('cluster_centers.json'), path('community_graph_dict.json')]
+    if not all(os.path.exists(name) for name in required):
+        return None
+
+    word_index, vectors = load_embeddings(path('embeddings'))
+    with open(path('cluster_centers.json')) as json_file:
+        cluster_centers = json.load(json_file)
+    with open(path('community_graph_dict.json')) as json_file:
+        community_graph_dict = json.load(json_file)
+    num_clusters = max(int(i) for i in cluster_centers) + 1
+    cluster_names = load_cluster_names(names_path, num_clusters)
+    title_link = None
+    if os.path.exists(path('titlelink.json')):
+        with open(path('titlelink.json')) as json_file:
+            title_link = json.load(json_file)
+    return Recommender(word_index, vectors, cluster_names, cluster_centers,
+                       cluster_graph_from_dict(community_graph_dict, num_clusters), title_link)
@@ -0,0 +1,136 @@
+import bisect
+import numpy as np
+
+def normalize(text):
+    """Lowercases text and collapses its whitespace, so that queries match subjects however they are typed"""
+    return ' '.join(text.casefold().split())
+
+def trigrams(text):
+    """Returns the set of trigrams of a normalized string, padded with spaces so that short words have trigrams too"""
+    padded = ' %s ' % text
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """An autocomplete index over a list of subjects
+
+    Prefix search runs on a sorted array of every word-start suffix of the normalized subjects, so typing 'hist' finds
+    both 'history of france' and 'french history' with a bisection. When there are fewer prefix matches than asked
+    for, the rest are filled with fuzzy matches, ranked by the share of the query's trigrams they contain, which
+    catches typos like 'frnech history', and also those in a single word of a longer subject, like 'histroy'.
+
+    Parameters
+    ---------------
+    subjects : List
+        The subjects to suggest
+    """
+
+    def __init__(self, subjects):
+        self.subjects = list(subjects)
+        keys = [normalize(subject) for subject in self.subjects]
+
+        suffixes = []
+        for i, key in enumerate(keys):
+            start = 0
+            while start != -1:
+                suffixes.append((key[start:], i))
+                start = key.find(' ', start)
+                start = start if start == -1 else start + 1
+        suffixes.sort()
+        self.suffixes = [suffix for suffix, i in suffixes]
+        self.suffix_ids = np.array([i for suffix, i in suffixes], dtype=np.int32)
+
+        # The trigrams of each subject, interned to ids and stored in CSR form, and the inverted index from trigrams
+        # to the ids of the subjects that contain them
+        self.gram_ids = dict()
+        subject_grams = [[self.gram_ids.setdefault(gram, len(self.gram_ids)) for gram in trigrams(key)] for key in keys]
+        self.num_trigrams = np.array([len(grams) for grams in subject_grams], dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(self.num_trigrams)])
+        self.grams = np.array([gram for grams in subject_grams for gram in grams], dtype=np.int32)
+        order = np.argsort(self.grams, kind='stable')
+        bounds = np.searchsorted(self.grams[order], np.arange(len(self.gram_ids) + 1))
+        subject_of = np.repeat(np.arange(len(keys), dtype=np.int32), self.num_trigrams)[order]
+        self.postings = [subject_of[bounds[g]:bounds[g + 1]] for g in range(len(self.gram_ids))]
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def prefix(self, query, limit=10):
+        """Returns the ids of up to limit subjects with a word starting with query, in alphabetical order of the match"""
+        query = normalize(query)
+        if not query or limit < 1:
+            return []
+        start = bisect.bisect_left(self.suffixes, query)
+        ids = dict()
+        for j in range(start, len(self.suffixes)):
+            if not self.suffixes[j].startswith(query):
+                break
+            ids[int(self.suffix_ids[j])] = None
+            if len(ids) == limit:
+                break
+        return list(ids)
+
+    def fuzzy(self, query, limit=10, threshold=0.3, max_candidates=1024):
+        """Returns the ids of up to limit subjects that contain the largest share of the query's trigrams, best first
+
+        The share is the containment |q ∩ s| / |q| of the query's trigrams in the subject's rather than their Jaccard
+        similarity, so that a query typed with a typo matches subjects much longer than it; subjects containing the
+        same share are ranked by their Jaccard similarity, which puts the closest in length first.
+
+        Parameters
+        ---------------
+        query : str
+            The text typed so far
+        limit : int
+            The number of subjects to return at most
+        threshold : float
+            The smallest share of the query's trigrams a subject must contain to be suggested
+        max_candidates : int
+            The largest number of subjects to score
+        """
+        if limit < 1:
+            return []
+        all_query_grams = trigrams(normalize(query))
+        query_grams = [self.gram_ids[gram] for gram in all_query_grams if gram in self.gram_ids]
+        num_query_grams = len(all_query_grams)
+        grams = sorted((self.postings[gram] for gram in query_grams), key=len)
+
+        # A subject containing at least threshold of the query shares need trigrams with it, so it must contain one
+        # of the len(grams) - need + 1 rarest: only those postings are merged, and the common trigrams are only
+        # looked up for these candidates. Queries made only of very common words would still gather a large part of
+        # the subjects, so the candidates are capped at max_candidates, which makes the match approximate for them
+        need = max(1, int(np.ceil(threshold * num_query_grams)))
+        if need > len(grams):
+            return []
+        probe, total = 0, 0
+        while probe < len(grams) - need + 1 and total + len(grams[probe]) <= max_candidates:
+            total += len(grams[probe])
+            probe += 1
+        if probe:
+            candidates = np.unique(np.concatenate(grams[:probe]))
+        else:
+            candidates = grams[0][::-(-len(grams[0]) // max_candidates)]
+        if not len(candidates):
+            return []
+
+        # Count the query's trigrams among each candidate's, gathering their CSR rows in one go
+        lengths = self.num_trigrams[candidates]
+        offsets = np.repeat(self.indptr[candidates] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        in_query = np.zeros(len(self.gram_ids), dtype=bool)
+        in_query[query_grams] = True
+        hits = in_query[self.grams[offsets + np.arange(len(offsets))]]
+        shared = np.bincount(np.repeat(np.arange(len(candidates)), lengths), weights=hits, minlength=len(candidates))
+        containment = shared / num_query_grams
+        jaccard = shared / (num_query_grams + lengths - shared)
+        keep = containment >= threshold
+        candidates = candidates[keep]
+        order = np.lexsort((-jaccard[keep], -containment[keep]))[:limit]
+        return [int(i) for i in candidates[order]]
+
+    def suggest(self, query, limit=10, fuzzy=True):
+        """Returns up to limit subjects matching query, prefix matches first and then, if fuzzy, the closest others"""
+        ids = self.prefix(query, limit)
+        if fuzzy and len(ids) < limit and len(normalize(query)) >= 3:
+            seen = set(ids)
+            ids += [i for i in self.fuzzy(query, limit) if i not in seen][:limit - len(ids)]
+        return [self.subjects[i] for i in ids]
@@ -1,5 +1,8 @@
 import json
 import gensim.downloader as api
+from rq import get_current_job
+from recommender import load_recommender
+from jobs import ResultCache, LOCK_PREFIX
 
 def load_info():
     """We load all the data we will need; most importantly the gensim word2vec model"""
@@ -27,4 +30,29 @@ def make_community_graph(community_graph_dict):
             community_graph.add_edge(i,j)
 
 def make_clust_names(cluster_names):
-    return {k: np.array(cluster_names[k]) for k in cluster_names}
\ No newline at end of file
+    return {k: np.array(cluster_names[k]) for k in cluster_names}
+
+_recommender = None
+
+def get_recommender():
+    """Loads the live recommender once per process; worker.py calls it before forking, so jobs share it"""
+    global _recommender
+    if _recommender is None:
+        _recommender = load_recommender()
+    return _recommender
+
+def recommend(subject):
+    """The rq job computing live recommendations for subject, run by worker.py
+
+    The result is written to the result cache the web processes read, as well as returned as the job's result.
+    """
+    recommender = get_recommender()
+    job = get_current_job()
+    try:
+        top_ten = recommender.recommend(subject) if recommender is not None else None
+        if job is not None:
+            ResultCache(job.connection).set(subject, top_ten or [])
+        return top_ten
+    finally:
+        if job is not None:
+            job.connection.delete(LOCK_PREFIX + job.id)
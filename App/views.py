@@ -2,56 +2,212 @@
 # from App import r
 # from App import q
 import os
-import secrets
+import gzip
 import time
-from flask import render_template, request, Blueprint, redirect, url_for
-from tasks import load_info
+import redis
+from flask import render_template, request, Blueprint, abort, jsonify, url_for, g, Response
+from werkzeug.http import quote_etag
+from rq import Queue
+from index import RecommendationIndex, build_index_from_json
+from suggest import SuggestIndex
+from recommender import load_recommender
+from jobs import ResultCache, enqueue_recommendation, job_status, JOB_PREFIX
+from metrics import Registry, CONTENT_TYPE
+from pages import PageCache, template_digest
 #from gensim.test.utils import common_texts
 #from gensim.models import Word2Vec
 #import gensim.downloader as api
-import json
-import numpy as np
-import networkx as nx
-from networkx.readwrite import json_graph
-from sklearn.metrics import pairwise_distances_argmin_min
-import requests
-#from rq import Queue
-#from worker import conn
-
-#q = Queue(connection=conn)
 
 views = Blueprint('views',__name__)
 
-def load_info():
-    """We load all the data we will need; most importantly the gensim word2vec model"""
+INDEX_PATH = os.getenv('INDEX_PATH', 'recommendations.db')
 
-    with open('answer_dict.json') as json_file:
-        subject_dict = json.load(json_file)
-    
-    return subject_dict
+def load_index(path=INDEX_PATH, json_path='answer_dict.json'):
+    """We open the recommendation index once per process, first building it from answer_dict.json if there is none
+
+    An index built from answer_dict.json is rebuilt when the json is newer. An index written by build_index.py, or one
+    whose source was not recorded, is never replaced: it already holds the recommendations of answer_dict.json, and
+    a deploy or a checkout touching the json would otherwise overwrite it with them alone.
+    """
+    if os.path.exists(json_path):
+        if not os.path.exists(path):
+            build_index_from_json(json_path, path)
+        elif os.path.getmtime(path) < os.path.getmtime(json_path) and RecommendationIndex(path).source() == 'json':
+            build_index_from_json(json_path, path)
+    return RecommendationIndex(path)
+
+# Request latencies and load times for /metrics, in the Prometheus text format
+registry = Registry()
+request_seconds = registry.histogram('wikigraph_request_duration_seconds', 'Latency of requests, by endpoint and status',
+                                     ('endpoint', 'method', 'status'))
+load_seconds = registry.gauge('wikigraph_load_seconds', 'Seconds taken to load each index when the process started',
+                              ('index',))
+index_subjects = registry.gauge('wikigraph_index_subjects', 'Number of subjects in the recommendation index')
+page_requests = registry.counter('wikigraph_page_requests_total',
+                                 'Results pages of indexed subjects, by whether they were cached, rendered or not modified',
+                                 ('result',))
+
+start = time.perf_counter()
+index = load_index()
+load_seconds.set(time.perf_counter() - start, 'recommendations')
+index_subjects.set(len(index))
+start = time.perf_counter()
+suggestions = SuggestIndex(index.subjects())
+load_seconds.set(time.perf_counter() - start, 'suggestions')
+
+# The results pages of the subjects of the index, rendered once; PRERENDER_PAGES renders them all when the app starts
+pages = PageCache('%s-%s' % (index.version(), template_digest(['base.html', 'results.html'])),
+                  int(os.getenv('PAGE_CACHE_SIZE', 10000)), int(os.getenv('PAGE_MAX_AGE', 300)))
+
+def prerender_pages():
+    """Renders the results page of every subject of the index into pages; needs a request context"""
+    start = time.perf_counter()
+    results = index.recommendations_many(index.subjects()[:pages.maxsize])
+    count = pages.prerender([subject for subject, top_ten in results.items() if top_ten],
+                            lambda subject: render_template('results.html', top_ten=results[subject]))
+    load_seconds.set(time.perf_counter() - start, 'pages')
+    return count
+
+# Live recommendations for subjects outside the index are computed by the rq worker when redis is configured, and
+# in the web process otherwise
+REDIS_URL = os.getenv('REDIS_URL')
+MAX_BATCH = 10000
+conn = redis.from_url(REDIS_URL) if REDIS_URL else None
+q = Queue(connection=conn) if conn is not None else None
+recommender = load_recommender() if q is None else None
+cache = ResultCache(conn)
+
+@views.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@views.after_app_request
+def record_latency(response):
+    if 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start, request.endpoint or 'none', request.method,
+                                response.status_code)
+    return response
+
+def live_recommendations(subject):
+    """Returns the live recommendations for subject and None if they are ready, or None and the id of the job
+    computing them"""
+    top_ten = cache.get(subject)
+    if top_ten is not None:
+        return top_ten, None
+    if q is not None:
+        return None, enqueue_recommendation(q, subject)
+    top_ten = (recommender.recommend(subject) if recommender is not None else None) or []
+    cache.set(subject, top_ten)
+    return top_ten, None
 
 @views.route('/')
 def home():
+    subject = request.args.get("subject")
+    if not subject:
+        return render_template('home.html')
     
-    # jobs = q.jobs
 
-    # task = q.enqueue(load_info)
+    # An ETag of the current pages is only ever sent for a subject of the index, so it can be answered at once
+    etag = pages.etag(subject)
+    if not request.if_none_match.star_tag and request.if_none_match.contains_weak(etag):
+        page_requests.inc('not_modified')
+        return Response(status=304, headers=page_headers(etag))
+    body = pages.get(subject)
+    if body is not None:
+        page_requests.inc('cached')
+        return page_response(body, etag)
 
-    subject_dict = load_info()
-           
-    
-    if not request.args.get("subject"):
-        return render_template('home.html', subject_dict=subject_dict)
-    
-    subject = request.args.get("subject")
-    top_ten = subject_dict[subject]
-    return render_template('results.html', subject_dict=subject_dict, top_ten=top_ten)
+    top_ten = index.recommendations(subject)
+    if top_ten is None:
+        top_ten, key = live_recommendations(subject)
+        if key is not None:
+            return render_template('waiting.html', status=job_status(q, key),
+                                   status_url=url_for('views.status', key=key)), 202
+        if not top_ten:
+            abort(404)
+        return render_template('results.html', top_ten=top_ten)
+    if not top_ten:
+        abort(404)
+    page_requests.inc('rendered')
+    return page_response(pages.set(subject, render_template('results.html', top_ten=top_ten)), etag)
+
+def page_headers(etag):
+    return {'ETag': quote_etag(etag, weak=True), 'Cache-Control': pages.cache_control, 'Vary': 'Accept-Encoding'}
 
+def page_response(body, etag):
+    """Returns a cached results page, compressed unless the client does not accept gzip"""
+    headers = page_headers(etag)
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        body = gzip.decompress(body)
+    return Response(body, content_type='text/html; charset=utf-8', headers=headers)
 
+@views.route('/recommend')
+def recommend():
+    """Returns the recommendations for a subject as json, or, while they are being computed, the url to poll"""
+    subject = request.args.get("subject", "")
+    top_ten = index.recommendations(subject)
+    if top_ten is None:
+        top_ten, key = live_recommendations(subject)
+        if key is not None:
+            return jsonify(subject=subject, job_id=key, status=job_status(q, key),
+                           status_url=url_for('views.status', key=key)), 202
+    if not top_ten:
+        abort(404)
+    return jsonify(subject=subject, status='finished', recommendations=top_ten)
 
+@views.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """Answers many subjects in one call
 
-        
+    The request body is {"subjects": [...]}, and the reply is {"results": {subject: recommendations}, "pending":
+    {subject: status_url}}, with an empty list of recommendations for subjects none of whose words is known. When
+    some subjects are still being computed by the worker the reply is a 202, and they can be polled or sent again.
+    """
+    body = request.get_json(silent=True) or {}
+    subjects = body.get('subjects')
+    if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+        abort(400)
+    if len(subjects) > MAX_BATCH:
+        abort(413)
 
+    results = index.recommendations_many(subjects)
+    results.update(cache.get_many([subject for subject in dict.fromkeys(subjects) if subject not in results]))
+    misses = [subject for subject in dict.fromkeys(subjects) if subject not in results]
+    pending = dict()
+    if q is not None:
+        for subject in misses:
+            pending[subject] = url_for('views.status', key=enqueue_recommendation(q, subject))
+    elif misses:
+        top_tens = recommender.recommend_many(misses) if recommender is not None else [None] * len(misses)
+        for subject, top_ten in zip(misses, top_tens):
+            results[subject] = top_ten or []
+            cache.set(subject, results[subject])
+    return jsonify(results=results, pending=pending), 202 if pending else 200
 
+@views.route('/status/<key>')
+def status(key):
+    """Returns the status of a recommendation job as json, with the recommendations once it has finished"""
+    if not key.startswith(JOB_PREFIX):
+        abort(404)
+    top_ten = cache.lookup(key[len(JOB_PREFIX):])
+    if top_ten is not None:
+        return jsonify(job_id=key, status='finished', recommendations=top_ten)
+    status = job_status(q, key) if q is not None else None
+    if status is None:
+        abort(404)
+    return jsonify(job_id=key, status=status)
 
+@views.route('/suggest')
+def suggest():
+    """Returns the subjects matching the text typed so far, as json, for the autocomplete of the subject box"""
+    query = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    fuzzy = request.args.get("fuzzy", "1") != "0"
+    return jsonify(query=query, suggestions=suggestions.suggest(query, limit, fuzzy))
 
+@views.route('/metrics')
+def metrics():
+    """Exposes the request latencies and load times of this process for Prometheus to scrape"""
+    return Response(registry.expose(), content_type=CONTENT_TYPE)
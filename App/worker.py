@@ -1,7 +1,7 @@
 import os
 
 import redis
-from rq import Worker, Queue, Connection
+from rq import Worker, Queue
 
 listen = ['high', 'default', 'low']
 
@@ -10,6 +10,8 @@ redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
 conn = redis.from_url(redis_url)
 
 if __name__ == '__main__':
-    with Connection(conn):
-        worker = Worker(map(Queue, listen))
-        worker.work()
\ No newline at end of file
+    import tasks
+    # Load the recommender before the worker forks a work horse for each job
+    tasks.get_recommender()
+    worker = Worker([Queue(name, connection=conn) for name in listen], connection=conn)
+    worker.work()
@@ -0,0 +1,152 @@
+"""A small, memory-mappable subset of the pre-trained word vectors, holding only the words that occur in our titles and
+categories
+
+The full glove-wiki-gigaword-300 model is about 1GB and takes a while to load; the words the crawl actually uses are
+a tiny fraction of its vocabulary. An export is a directory holding
+    vocab.json  : the list of words, in the order of the rows of vectors.npy
+    vectors.npy : float32 array of shape (len(vocab), dim), one word vector per row
+    meta.json   : the name of the model the vectors were taken from, and their dimension
+The vectors are loaded memory-mapped, so only the rows that are actually gathered are ever read from disk.
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from gensim.parsing.preprocessing import STOPWORDS
+
+MODEL_NAME = 'glove-wiki-gigaword-300'
+
+
+def tokenize(phrases):
+    """Yields the lowercased words of each phrase that are not stopwords, as get_cluster_names has always split them"""
+    for phrase in phrases:
+        for word in phrase.lower().split():
+            if word not in STOPWORDS:
+                yield word
+
+
+class Embeddings:
+    """Word vectors over a fixed vocabulary
+
+    It has the attributes of a gensim KeyedVectors that get_cluster_names uses (vectors, key_to_index,
+    index_to_key), so either can be passed to it.
+
+    Parameters
+    ---------------
+    words : List
+        The vocabulary, in the order of the rows of vectors
+    vectors : Array
+        A float32 array with one row per word
+    """
+
+    def __init__(self, words, vectors):
+        self.index_to_key = words
+        self.key_to_index = {word: i for i, word in enumerate(words)}
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.index_to_key)
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    def get_vector(self, word):
+        return self.vectors[self.key_to_index[word]]
+
+
+def corpus_words(category_dict, titles=()):
+    """Returns the set of words of the titles and categories of a category_dict, tokenized as for naming clusters
+
+    Parameters
+    ---------------
+    category_dict : Dict
+        A dictionary keyed by titles, and valued with lists of categories, like cats.json
+    titles : iterable of str
+        Any further titles, e.g. the nodes of graph.json that have no categories
+    """
+    words = set(tokenize(category_dict))
+    words.update(tokenize(titles))
+    for categories in category_dict.values():
+        words.update(tokenize(categories))
+    return words
+
+
+def export_subset(model, words, directory, model_name=MODEL_NAME):
+    """Writes the vectors of the words that model knows to directory, in the format described at the top of this module
+
+    Parameters
+    ---------------
+    model : gensim KeyedVectors
+        The full pre-trained model, e.g. gensim.downloader.load('glove-wiki-gigaword-300')
+    words : iterable of str
+        The words to keep; those model does not know are dropped
+    directory : str
+        The directory to write to
+
+    Returns
+    ---------------
+    embeddings : Embeddings
+        The exported subset
+    """
+    words = sorted(word for word in set(words) if word in model.key_to_index)
+    rows = [model.key_to_index[word] for word in words]
+    vectors = np.asarray(model.vectors[rows], dtype=np.float32).reshape(len(words), model.vector_size)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'vocab.json'), 'w') as f:
+        json.dump(words, f)
+    np.save(os.path.join(directory, 'vectors.npy'), vectors)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'model': model_name, 'dim': model.vector_size}, f)
+    return Embeddings(words, vectors)
+
+
+def load_embeddings(directory, mmap=True):
+    """Reads an Embeddings written by export_subset
+
+    Parameters
+    ---------------
+    directory : str
+        The directory the subset was exported to
+    mmap : bool
+        If True, memory-map the vectors rather than reading them into memory
+
+    Returns
+    ---------------
+    embeddings : Embeddings
+    """
+    with open(os.path.join(directory, 'vocab.json')) as f:
+        words = json.load(f)
+    vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r' if mmap else None)
+    return Embeddings(words, vectors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the word vectors of the words in our titles and categories')
+    parser.add_argument('cats', help='the category dictionary written by the crawl, e.g. cats.json')
+    parser.add_argument('out', help='the directory to write the subset to')
+    parser.add_argument('--graph', help='a graph json whose node titles should be included too, e.g. graph.json')
+    parser.add_argument('--model', default=MODEL_NAME, help='the gensim model to take the vectors from')
+    args = parser.parse_args(argv)
+
+    import gensim.downloader as api
+
+    with open(args.cats) as f:
+        category_dict = json.load(f)
+    titles = []
+    if args.graph:
+        with open(args.graph) as f:
+            graph_dict = json.load(f)
+        titles = set(graph_dict).union(*graph_dict.values())
+    words = corpus_words(category_dict, titles)
+    embeddings = export_subset(api.load(args.model), words, args.out, args.model)
+    print('Exported %d of %d words' % (len(embeddings), len(words)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Quality metrics for the recommendations, so that every rebuild of the clusters and the index can be compared with the
+last one
+
+Two measures are computed for each query of an answer set (a json dictionary like answer_dict.json, from subjects to
+lists of [title, link] pairs), as in the plots of the README:
+    graph distance : the length of the shortest path in the crawl graph from the query to each recommended page. A
+                     query that is itself a page of the graph starts from that page; any other subject starts from
+                     every page of its nearest cluster at once.
+    similarity     : the cosine similarity between the mean word vector of the query and that of each recommended title
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from multiprocessing import Pool
+
+from GraphStore import load_graph
+from Embeddings import tokenize, load_embeddings
+
+_adjacency = None
+
+
+def load_answers(path):
+    """Reads an answer set, and returns its subjects and, for each, the list of recommended titles"""
+    with open(path) as f:
+        answers = json.load(f)
+    return list(answers), [[title for title, link in answers[subject]] for subject in answers]
+
+
+def mean_vectors(embeddings, texts):
+    """Returns the mean word vector of each of texts as the rows of one array, computed with a single sparse product
+
+    Parameters
+    ---------------
+    embeddings : Embeddings or gensim KeyedVectors
+        The word vectors
+    texts : List
+        The subjects or titles to embed
+
+    Returns
+    ---------------
+    vectors : Array
+        A float32 array with one row per text, of zeros for texts none of whose words has a vector
+    known : Array
+        A boolean mask of the texts that had a word with a vector
+    """
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        words = [embeddings.key_to_index[word] for word in tokenize([text]) if word in embeddings.key_to_index]
+        rows.extend([i] * len(words))
+        cols.extend(words)
+    counts = np.bincount(np.asarray(rows, dtype=np.int64), minlength=len(texts)).astype(np.float32)
+    weights = 1 / counts[rows] if rows else np.zeros(0, dtype=np.float32)
+    mean = scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(len(texts), len(embeddings.vectors)))
+    return np.asarray(mean @ embeddings.vectors, dtype=np.float32), counts > 0
+
+
+def cosine_similarities(embeddings, subjects, recommendations):
+    """Returns, for each subject, the array of cosine similarities between it and each of its recommended titles
+
+    All subjects and titles are embedded together, and the similarities of all pairs are computed with one row-wise
+    product; pairs where either side has no word with a vector get nan.
+    """
+    titles = [title for titles in recommendations for title in titles]
+    vectors, known = mean_vectors(embeddings, list(subjects) + titles)
+    norms = np.linalg.norm(vectors, axis=1)
+    vectors /= np.where(norms > 0, norms, 1)[:, None]
+
+    lengths = np.array([len(titles) for titles in recommendations], dtype=np.int64)
+    query = np.repeat(np.arange(len(subjects)), lengths)
+    target = len(subjects) + np.arange(len(titles))
+    similarity = np.einsum('ij,ij->i', vectors[query], vectors[target])
+    similarity[~(known[query] & known[target])] = np.nan
+    return np.split(similarity, np.cumsum(lengths)[:-1])
+
+
+def query_sources(subjects, titles, clusters=None, cluster_names=None, embeddings=None):
+    """Returns, for each subject, the indices of the graph nodes its graph distances are measured from
+
+    Parameters
+    ---------------
+    subjects : List
+        The queries
+    titles : List
+        The title of each node of the graph
+    clusters : Dict or None
+        A dictionary like clusters.json; with cluster_names and embeddings, subjects that are not titles of the graph
+        start from every node of the cluster whose name vector is the most similar to theirs
+    cluster_names : Dict or None
+        A dictionary like the output of get_cluster_names
+    embeddings : Embeddings or None
+        The word vectors the cluster names were computed with
+
+    Returns
+    ---------------
+    sources : List
+        A tuple of node indices for each subject, empty if it could not be placed in the graph
+    """
+    index = {title: i for i, title in enumerate(titles)}
+    sources = [(index[subject],) if subject in index else () for subject in subjects]
+    unplaced = [i for i, source in enumerate(sources) if not source]
+    if unplaced and clusters is not None and cluster_names is not None and embeddings is not None:
+        labels = list(cluster_names)
+        names = np.array([cluster_names[label] for label in labels], dtype=np.float32)
+        norms = np.linalg.norm(names, axis=1)
+        names /= np.where(norms > 0, norms, 1)[:, None]
+        vectors, known = mean_vectors(embeddings, [subjects[i] for i in unplaced])
+        nearest = np.argmax(vectors @ names.T, axis=1)
+        for i, label, placed in zip(unplaced, nearest, known):
+            if placed:
+                sources[i] = tuple(index[title] for title in clusters[labels[label]] if title in index)
+    return sources
+
+
+def _init_worker(adjacency):
+    global _adjacency
+    _adjacency = adjacency
+
+
+def _distances(args):
+    sources, targets, max_distance = args
+    if not sources:
+        return np.full(len(targets), np.nan)
+    distances = scipy.sparse.csgraph.dijkstra(_adjacency, indices=list(sources), min_only=True, unweighted=True,
+                                              limit=max_distance)
+    return distances[list(targets)]
+
+
+def graph_distances(adjacency, sources, targets, max_distance=np.inf, processes=None):
+    """Returns, for each query, the array of graph distances from its sources to each of its targets
+
+    The distances from all the sources of a query are found with one multi-source breadth-first search, and queries
+    with the same sources share it. The searches run in parallel over a pool of processes.
+
+    Parameters
+    ---------------
+    adjacency : scipy.sparse.csr_matrix
+        The adjacency matrix of the graph
+    sources : List
+        A tuple of node indices for each query, like the output of query_sources
+    targets : List
+        A list of node indices for each query
+    max_distance : float
+        Searches stop at this distance; farther targets get inf, like unreachable ones
+    processes : int or None
+        The number of processes of the pool; defaults to the number of cpus, and 1 searches in this process
+
+    Returns
+    ---------------
+    distances : List
+        An array of distances for each query; nan for every target of a query without sources
+    """
+    searches = list(dict.fromkeys(sources))
+    position = {source: i for i, source in enumerate(searches)}
+    wanted = [set() for _ in searches]
+    for source, target in zip(sources, targets):
+        wanted[position[source]].update(target)
+    wanted = [sorted(w) for w in wanted]
+    tasks = [(source, w, max_distance) for source, w in zip(searches, wanted)]
+
+    if processes == 1:
+        _init_worker(adjacency)
+        found = list(map(_distances, tasks))
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(adjacency,)) as pool:
+            found = pool.map(_distances, tasks, chunksize=max(1, len(tasks) // (8 * (processes or 4))))
+    lookup = [dict(zip(w, d)) for w, d in zip(wanted, found)]
+    return [np.array([lookup[position[source]][t] for t in target], dtype=np.float64)
+            for source, target in zip(sources, targets)]
+
+
+def summarize(values):
+    """Returns the count, mean and quartiles of the finite values of a list of arrays"""
+    values = np.concatenate(values) if len(values) else np.zeros(0)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return {'count': 0}
+    return {'count': int(len(values)), 'mean': float(values.mean()), 'p10': float(np.percentile(values, 10)),
+            'p50': float(np.percentile(values, 50)), 'p90': float(np.percentile(values, 90))}
+
+
+def evaluate(subjects, recommendations, graph, embeddings=None, clusters=None, cluster_names=None,
+             max_distance=np.inf, processes=None):
+    """Computes the graph distance and similarity metrics of an answer set
+
+    Parameters
+    ---------------
+    subjects, recommendations : List
+        The output of load_answers
+    graph : GraphStore.CSRGraph
+        The crawl graph
+    embeddings : Embeddings or None
+        The word vectors; without them only the graph distances from subjects that are pages of the graph are measured
+    clusters, cluster_names : Dict or None
+        Used to place the subjects that are not pages of the graph, see query_sources
+    max_distance : float
+        The distance beyond which recommended pages count as unreachable
+    processes : int or None
+        The number of processes to search the graph with
+
+    Returns
+    ---------------
+    metrics : Dict
+        A summary of the distances and similarities over the whole answer set, and their per-query means
+    """
+    start = time.time()
+    index = {title: i for i, title in enumerate(graph.titles)}
+    sources = query_sources(subjects, graph.titles, clusters, cluster_names, embeddings)
+    targets = [[index[title] for title in titles if title in index] for titles in recommendations]
+    distances = graph_distances(graph.adjacency(), sources, targets, max_distance, processes)
+    all_distances = np.concatenate(distances) if distances else np.zeros(0)
+    placed = all_distances[~np.isnan(all_distances)]
+    histogram = np.bincount(placed[np.isfinite(placed)].astype(np.int64)) if len(placed) else np.zeros(0)
+
+    metrics = {
+        'queries': len(subjects),
+        'placed_queries': sum(1 for source in sources if source),
+        'distance': summarize(distances),
+        'distance_histogram': {str(d): int(c) for d, c in enumerate(histogram) if c},
+        'unreachable': int(np.isinf(placed).sum()),
+        'within_3': float(np.mean(placed <= 3)) if len(placed) else None,
+        'per_query': {subject: {'distance': float(d[np.isfinite(d)].mean()) if np.isfinite(d).any() else None}
+                      for subject, d in zip(subjects, distances)},
+    }
+    if embeddings is not None:
+        similarities = cosine_similarities(embeddings, subjects, recommendations)
+        metrics['similarity'] = summarize(similarities)
+        for subject, s in zip(subjects, similarities):
+            metrics['per_query'][subject]['similarity'] = float(np.nanmean(s)) if np.isfinite(s).any() else None
+    metrics['seconds'] = time.time() - start
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the quality metrics of a set of recommendations')
+    parser.add_argument('answers', help='the recommendations, e.g. App/answer_dict.json')
+    parser.add_argument('graph', help='the crawl graph, as a GraphStore directory')
+    parser.add_argument('--embeddings', help='the word vector subset exported by Embeddings.py')
+    parser.add_argument('--clusters', help='clusters.json, to place subjects that are not pages of the graph')
+    parser.add_argument('--cluster-names', help='the cluster name vectors, as json')
+    parser.add_argument('--max-distance', type=float, default=np.inf)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', help='write the metrics to this json file rather than to stdout')
+    args = parser.parse_args(argv)
+
+    subjects, recommendations = load_answers(args.answers)
+    embeddings = load_embeddings(args.embeddings) if args.embeddings else None
+    clusters = cluster_names = None
+    if args.clusters and args.cluster_names:
+        with open(args.clusters) as f:
+            clusters = json.load(f)
+        with open(args.cluster_names) as f:
+            cluster_names = json.load(f)
+    metrics = evaluate(subjects, recommendations, load_graph(args.graph), embeddings, clusters, cluster_names,
+                       args.max_distance, args.processes)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(metrics, f, indent=1)
+    else:
+        json.dump(metrics, sys.stdout, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""A compact on-disk format for the crawl graphs, replacing the json dict-of-lists of graph.json and
+community_graph.json
+
+A graph is stored as a directory holding
+    titles.json : the interned table of node titles; the keys of the original dict come first, in order
+    indptr.npy  : int32 array of length len(titles) + 1
+    indices.npy : int32 array; the neighbours of titles[i] are titles[indices[indptr[i]:indptr[i + 1]]], in the
+                  order of the original lists, duplicates included
+    meta.json   : the number of keys of the original dict, and whether its values were ints (as in the cluster
+                  graphs) rather than titles
+The two arrays are loaded memory-mapped, so loading costs next to nothing and forked processes share them.
+"""
+
+import os
+import sys
+import json
+import numpy as np
+import scipy.sparse
+
+
+class CSRGraph:
+    """A directed graph in compressed sparse row form, over an interned table of node titles
+
+    It offers the parts of the NetworkX graph interface the analysis uses (nodes, edges, len), so it can be passed to
+    the ProjectAlgorithm functions in place of the NetworkX graph built from graph.json, and adjacency() returns the
+    scipy adjacency matrix directly.
+
+    Parameters
+    ---------------
+    titles : List
+        The title of each node
+    indptr : Array
+        The row pointers of the CSR structure, of length len(titles) + 1
+    indices : Array
+        The column indices of the CSR structure
+    num_keys : int or None
+        The number of nodes that were keys of the original dict; defaults to all of them
+    int_values : bool
+        Whether the values of the original dict were ints rather than titles
+    """
+
+    def __init__(self, titles, indptr, indices, num_keys=None, int_values=False):
+        self.titles = titles
+        self.indptr = indptr
+        self.indices = indices
+        self.num_keys = len(titles) if num_keys is None else num_keys
+        self.int_values = int_values
+        self._index = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def nodes(self):
+        return self.titles
+
+    @property
+    def edges(self):
+        """The undirected edges (title, title) of the graph, each once, as nx.Graph(graph_dict).edges would give"""
+        A = scipy.sparse.triu(self.adjacency(), format='coo')
+        return [(self.titles[i], self.titles[j]) for i, j in zip(A.row, A.col)]
+
+    def index(self, title):
+        """The position of title in the title table"""
+        if self._index is None:
+            self._index = {title: i for i, title in enumerate(self.titles)}
+        return self._index[title]
+
+    def neighbours(self, title):
+        """The titles title links to, in the order of the original list"""
+        i = self.index(title)
+        return [self.titles[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def adjacency(self, symmetric=True):
+        """Returns the adjacency matrix as a scipy CSR matrix of floats
+
+        Parameters
+        ---------------
+        symmetric : bool
+            If True, return the 0/1 adjacency matrix of the undirected graph, as nx.Graph(graph_dict) would give; if
+            False, return the directed matrix, with repeated links counted as edge weights
+
+        Returns
+        ---------------
+        A : scipy.sparse.csr_matrix
+            The n x n adjacency matrix, indexed like the title table
+        """
+        n = len(self.titles)
+        data = np.ones(len(self.indices), dtype=np.float64)
+        A = scipy.sparse.csr_matrix((data, self.indices, self.indptr), shape=(n, n), copy=True)
+        A.sum_duplicates()
+        if symmetric:
+            A = A + A.T
+            A.data[:] = 1
+            A = A.tocsr()
+        return A
+
+    def to_dict(self):
+        """Converts back to the dict-of-lists the graph was made from, exactly"""
+        values = [int(title) for title in self.titles] if self.int_values else self.titles
+        return {self.titles[i]: [values[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+                for i in range(self.num_keys)}
+
+
+def from_dict(graph_dict):
+    """Interns the titles of a dict-of-lists graph like graph.json, and builds its CSRGraph
+
+    Parameters
+    ---------------
+    graph_dict : Dict
+        A dictionary whose keys are nodes and whose values are lists of neighbouring nodes
+
+    Returns
+    ---------------
+    graph : CSRGraph
+        The same graph in CSR form; graph.to_dict() == graph_dict
+    """
+    int_values = any(isinstance(j, int) for values in graph_dict.values() for j in values)
+    index = {str(title): i for i, title in enumerate(graph_dict)}
+    titles = list(index)
+    indptr = np.zeros(len(graph_dict) + 1, dtype=np.int64)
+    indices = []
+    for i, values in enumerate(graph_dict.values()):
+        for j in values:
+            j = str(j)
+            if j not in index:
+                index[j] = len(titles)
+                titles.append(j)
+            indices.append(index[j])
+        indptr[i + 1] = len(indices)
+
+    # Nodes that only appear as values have no neighbours
+    indptr = np.concatenate([indptr, np.full(len(titles) - len(graph_dict), indptr[-1])])
+    if indptr[-1] >= 2**31:
+        raise ValueError('Graph has too many edges for int32 indices')
+    return CSRGraph(titles, indptr.astype(np.int32), np.array(indices, dtype=np.int32), len(graph_dict), int_values)
+
+
+def save_graph(graph, directory):
+    """Writes a CSRGraph to directory in the format described at the top of this module"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'titles.json'), 'w') as f:
+        json.dump(graph.titles, f)
+    np.save(os.path.join(directory, 'indptr.npy'), np.asarray(graph.indptr, dtype=np.int32))
+    np.save(os.path.join(directory, 'indices.npy'), np.asarray(graph.indices, dtype=np.int32))
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'num_keys': graph.num_keys, 'int_values': graph.int_values}, f)
+
+
+def load_graph(directory, mmap=True):
+    """Reads a CSRGraph written by save_graph
+
+    Parameters
+    ---------------
+    directory : str
+        The directory the graph was saved to
+    mmap : bool
+        If True, memory-map the index arrays rather than reading them into memory
+
+    Returns
+    ---------------
+    graph : CSRGraph
+    """
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(directory, 'titles.json')) as f:
+        titles = json.load(f)
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    indptr = np.load(os.path.join(directory, 'indptr.npy'), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(directory, 'indices.npy'), mmap_mode=mmap_mode)
+    return CSRGraph(titles, indptr, indices, meta['num_keys'], meta['int_values'])
+
+
+def convert_json(json_path, directory):
+    """Converts a dict-of-lists json graph like graph.json or community_graph.json to a CSRGraph directory, checking
+    that the conversion is lossless"""
+    with open(json_path) as f:
+        graph_dict = json.load(f)
+    graph = from_dict(graph_dict)
+    if graph.to_dict() != graph_dict:
+        raise ValueError('Conversion of %s is not lossless' % json_path)
+    save_graph(graph, directory)
+    return graph
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('Usage: python GraphStore.py GRAPH_JSON OUTPUT_DIRECTORY')
+    convert_json(sys.argv[1], sys.argv[2])
@@ -0,0 +1,223 @@
+"""Opt-in instrumentation of the crawl and the analysis: wall time, CPU time, peak memory and throughput of each stage,
+and profiles of whole runs
+
+Instrumentation is off unless the WIKIGRAPH_METRICS environment variable is set, to the path of a json file the
+measurements are written to when the process exits, or enable() is called; while it is off, an instrumented function
+costs one extra function call and a flag check. The WikiScraper and ProjectAlgorithm functions are instrumented with
+the stage decorator, and each stage records
+    calls, wall_seconds, cpu_seconds : totals over all calls
+    items                            : a count of what the stage processed, e.g. pages crawled or nodes projected
+    bytes                            : the size of what it processed, e.g. of the fetched html
+    peak_rss_mb                      : the peak resident memory of the process at the end of a call, and
+    rss_growth_mb                    : how much the calls raised it
+    latency                          : a histogram of the wall time of the calls, on the bucket bounds of BUCKETS
+from which report derives rates such as pages per second. CPU time is that of the whole process, so it includes
+the other threads of a concurrent crawl.
+
+profile() wraps a run in cProfile, or in a sampling profiler that writes the folded stacks flamegraph.pl reads.
+
+Usage: WIKIGRAPH_METRICS=metrics.json python WikiScraper.py crawl wiki/Gupta_Empire
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import inspect
+import resource
+import functools
+import threading
+import contextlib
+from collections import Counter
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_enabled = False
+_path = None
+_lock = threading.Lock()
+_stages = dict()
+
+
+def enable(path=None):
+    """Turns instrumentation on; if path is given, the report is written there when the process exits"""
+    global _enabled, _path
+    _enabled = True
+    if path and _path is None:
+        atexit.register(lambda: dump(_path))
+    _path = path or _path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """Forgets every measurement made so far"""
+    with _lock:
+        _stages.clear()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def observe(name, wall, cpu=0.0, items=0, size=0, rss_before=None):
+    """Records one call of stage name, for code that is not a single function call"""
+    peak = _peak_rss_mb()
+    with _lock:
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'items': 0, 'bytes': 0,
+                                     'peak_rss_mb': 0.0, 'rss_growth_mb': 0.0, 'latency': [0] * (len(BUCKETS) + 1)}
+        stats['calls'] += 1
+        stats['wall_seconds'] += wall
+        stats['cpu_seconds'] += cpu
+        stats['items'] += items
+        stats['bytes'] += size
+        stats['peak_rss_mb'] = max(stats['peak_rss_mb'], peak)
+        if rss_before is not None:
+            stats['rss_growth_mb'] += peak - rss_before
+        stats['latency'][sum(1 for bound in BUCKETS if wall > bound)] += 1
+
+
+def stage(name=None, items=None, size=None, grows=None):
+    """Decorates a function, or a coroutine function, so that its calls are recorded as stage name while
+    instrumentation is on
+
+    Parameters
+    ---------------
+    name : str or None
+        The name of the stage; defaults to the name of the function, and functions may share a stage
+    items : callable or None
+        Called as items(result, *args, **kwargs), returns the number of items the call processed
+    size : callable or None
+        Called as size(result, *args, **kwargs), returns the number of bytes the call processed
+    grows : callable or None
+        Called as grows(*args, **kwargs) before and after the call, for functions that fill in their arguments, like
+        the crawls; the difference is the number of items
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        def record(result, args, kwargs, before, wall, cpu, rss):
+            observe(stage_name, wall, cpu,
+                    (items(result, *args, **kwargs) if items else 0) + (grows(*args, **kwargs) - before if grows else 0),
+                    size(result, *args, **kwargs) if size else 0, rss)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                before, rss = grows(*args, **kwargs) if grows else 0, _peak_rss_mb()
+                start, cpu = time.perf_counter(), time.process_time()
+                result = await function(*args, **kwargs)
+                record(result, args, kwargs, before, time.perf_counter() - start, time.process_time() - cpu, rss)
+                return result
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return function(*args, **kwargs)
+                before, rss = grows(*args, **kwargs) if grows else 0, _peak_rss_mb()
+                start, cpu = time.perf_counter(), time.process_time()
+                result = function(*args, **kwargs)
+                record(result, args, kwargs, before, time.perf_counter() - start, time.process_time() - cpu, rss)
+                return result
+        return wrapper
+    return decorator
+
+
+def report():
+    """Returns the measurements of every stage, with their mean latency and their throughput in items and bytes
+    per second of wall time"""
+    with _lock:
+        stages = {name: dict(stats, latency=list(stats['latency'])) for name, stats in _stages.items()}
+    for stats in stages.values():
+        wall = stats['wall_seconds']
+        stats['mean_seconds'] = wall / stats['calls']
+        stats['items_per_second'] = stats['items'] / wall if wall else None
+        stats['bytes_per_second'] = stats['bytes'] / wall if wall else None
+    return {'pid': os.getpid(), 'buckets': list(BUCKETS), 'peak_rss_mb': _peak_rss_mb(), 'stages': stages}
+
+
+def dump(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=1)
+
+
+class SamplingProfiler:
+    """Samples the stack of the main thread every interval seconds of CPU time, and counts the folded stacks"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+
+@contextlib.contextmanager
+def profile(path, mode='cprofile', interval=0.005):
+    """Profiles the code run within the context, writing the profile to path
+
+    Parameters
+    ---------------
+    path : str
+        The file the profile is written to: pstats data for 'cprofile', to read with python -m pstats or snakeviz,
+        or folded stacks for 'sampling', to draw with flamegraph.pl
+    mode : str
+        'cprofile', which traces every call of this thread, or 'sampling', whose overhead is small enough to profile
+        long runs
+    interval : float
+        The CPU time in seconds between samples of 'sampling'
+    """
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif mode == 'sampling':
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            profiler.dump(path)
+    else:
+        raise ValueError("mode must be 'cprofile' or 'sampling', not %r" % mode)
+
+
+if os.getenv('WIKIGRAPH_METRICS'):
+    enable(os.getenv('WIKIGRAPH_METRICS'))
@@ -0,0 +1,122 @@
+import sqlite3
+import zlib
+import hashlib
+import time
+from collections import namedtuple
+
+CachedPage = namedtuple('CachedPage', ['url', 'html', 'etag', 'last_modified', 'fetched_at'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    html BLOB NOT NULL
+);
+"""
+
+
+class PageStore:
+    """A persistent, compressed store of crawled Wikipedia pages, kept in a single SQLite file
+
+    Page bodies are zlib-compressed and content-addressed by their sha256 digest, so a page reached under several
+    links, or fetched again unchanged, is only stored once. Each key also keeps the ETag and Last-Modified headers
+    the page was served with, so that a re-crawl can revalidate it with a conditional request instead of
+    downloading it again.
+
+    Parameters
+    ---------------
+    path : str
+        The path of the SQLite file; it is created if it does not exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.conn.execute('SELECT 1 FROM pages WHERE key = ?', (key,)).fetchone() is not None
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, key):
+        """Returns the CachedPage stored under key, or None if the page has never been stored
+
+        Parameters
+        ---------------
+        key : str
+            The key the page was stored under; the crawler uses normalize_link of the requested link
+
+        Returns
+        ---------------
+        page : CachedPage or None
+            A namedtuple of the url the page was served from, its html, its ETag and Last-Modified headers, and
+            the time it was last fetched or revalidated
+        """
+        row = self.conn.execute('SELECT url, html, etag, last_modified, fetched_at FROM pages '
+                                'JOIN blobs USING (digest) WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        url, html, etag, last_modified, fetched_at = row
+        return CachedPage(url, zlib.decompress(html).decode('utf-8'), etag, last_modified, fetched_at)
+
+    def put(self, key, url, html, etag=None, last_modified=None):
+        """Stores the html of a page under key, along with the url it was served from and its validators"""
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO blobs (digest, html) VALUES (?, ?)',
+                              (digest, zlib.compress(data, 6)))
+            self.conn.execute('INSERT OR REPLACE INTO pages (key, url, digest, etag, last_modified, fetched_at) '
+                              'VALUES (?, ?, ?, ?, ?, ?)', (key, url, digest, etag, last_modified, time.time()))
+
+    def fetched_at(self, key):
+        """Returns the time the page stored under key was last fetched or revalidated, or None if it is not stored"""
+        row = self.conn.execute('SELECT fetched_at FROM pages WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, key):
+        """Marks the page stored under key as fresh, after the server has answered 304 Not Modified"""
+        with self.conn:
+            self.conn.execute('UPDATE pages SET fetched_at = ? WHERE key = ?', (time.time(), key))
+
+    def items(self):
+        """Iterates over (key, CachedPage) pairs for every stored page, e.g. to benchmark parsing offline"""
+        rows = self.conn.execute('SELECT key, url, html, etag, last_modified, fetched_at FROM pages '
+                                 'JOIN blobs USING (digest)')
+        for key, url, html, etag, last_modified, fetched_at in rows:
+            yield key, CachedPage(url, zlib.decompress(html).decode('utf-8'), etag, last_modified, fetched_at)
+
+    def prune(self):
+        """Deletes the bodies no key points to any more, i.e. old versions of pages that have since changed"""
+        with self.conn:
+            self.conn.execute('DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM pages)')
+
+
+def revalidation_headers(page):
+    """Returns the conditional request headers to revalidate a CachedPage with, or no headers if page is None"""
+    headers = dict()
+    if page is not None:
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+    return headers
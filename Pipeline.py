@@ -0,0 +1,546 @@
+"""Runs the whole analysis, from the crawl to the files the App serves, caching every stage
+
+The stages are
+    crawl         : graph.json, titlelink.json and cats.json, crawled with WikiScraper or copied from an earlier crawl
+    graph         : the crawl graph in GraphStore form
+    stats         : the GraphStats statistics of the graph, warm-started from those of base.json
+    eigen         : the top eigenvectors of the graph, from project_graph
+    clusters      : labels.npy, clusters.json and cluster_centers.json, from find_clusters on the top dim eigenvectors
+    extend        : with --incremental, the projection of base.json with the new nodes placed into it
+    assign        : with --incremental, the clusters of base.json with the new nodes added, as clusters writes them
+    categories    : cluster_categories.json
+    names         : cluster_names.json, from get_cluster_names with a word vector subset exported by Embeddings.py
+    cluster_graph : community_graph_dict.json and stats.json, from make_cluster_graph
+
+Each stage writes its files to a directory of the cache named after a hash of its parameters and of the keys of the
+stages it reads, so a stage only runs again when something it depends on has changed; a crawl copied from a directory
+is keyed by the contents of its files. Stages whose inputs are ready run in parallel in a pool of processes, or one
+after the other in this process with --processes 0.
+
+Several values of --dim and --clusters make a sweep over every combination: the crawl, the graph and the
+eigen-decomposition are shared by all of them, as the eigenvectors are computed once for the largest dim and each
+projection takes the top dim of them. The results of every combination are summarized in sweep.json.
+
+With --incremental, e.g. after a nightly incremental crawl, the projection and clusters of the last run that
+computed them (recorded in base.json) are updated rather than recomputed: the extend stage places the nodes added
+since into the projection with ProjectAlgorithm.extend_projection, and the assign stage puts each of them in the
+cluster with the nearest mean, the other nodes keeping theirs. Updates always start from that run, so the drift
+accounts for every node added since, and an update of an unchanged crawl is found in the cache. The projection is
+only recomputed, from scratch, when its drift, as measured by ProjectAlgorithm.projection_drift, is above
+--drift-threshold; the default of 0.02 is about where, on graph.json, the extended projection stops spanning the
+same subspace as a recomputed one, which happens once 2-5% of the pages are new.
+
+With --metrics FILE, each stage also writes the Instrument measurements of the WikiScraper and ProjectAlgorithm
+functions it ran to metrics.json, and those of every stage of the run are gathered into FILE. --profile FILE profiles
+the run with Instrument.profile, running the stages in this process so that the profile covers them.
+
+Usage: python Pipeline.py (--crawl-dir DIR | --seeds LINK [LINK ...]) --dim 10 --clusters 1000 [--embeddings DIR]
+                          [--cache .pipeline] [--app App] [--incremental] [--metrics FILE] [--profile FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import itertools
+import contextlib
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import Instrument
+
+# Bumped whenever a stage changes what it writes, so that older cached results are not reused
+VERSION = 4
+
+# params are the arguments a stage is keyed by, inputs the stages whose results it reads, and paths the arguments
+# naming files outside the cache, which are keyed by a digest of their contents in params rather than by where they are
+Stage = namedtuple('Stage', ['name', 'function', 'params', 'inputs', 'paths'], defaults=[{}])
+
+
+def file_digest(path, block_size=2**20):
+    """Returns the sha256 digest of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_digest(directory, names):
+    """Returns a digest of the names and contents of those of the named files that directory holds"""
+    paths = [os.path.join(directory, name) for name in names]
+    return hashlib.sha256(json.dumps([(os.path.basename(path), file_digest(path))
+                                      for path in paths if os.path.exists(path)]).encode()).hexdigest()
+
+
+def _load_json(directory, name):
+    with open(os.path.join(directory, name)) as f:
+        return json.load(f)
+
+
+def _save_json(directory, name, obj):
+    with open(os.path.join(directory, name), 'w') as f:
+        json.dump(obj, f)
+
+
+def crawl_stage(out, seeds, depth, base_url, processes, concurrency, rate_limit, store, offline):
+    """Crawls outward from seeds, as WikiScraper's crawl command does"""
+    from WikiScraper import bfs_search, concurrent_bfs_search, sharded_bfs_search, save_dictionaries
+    from PageStore import PageStore
+
+    dictionaries = [dict(), dict(), dict()]
+    page_store = PageStore(store) if store else None
+    if processes:
+        sharded_bfs_search(seeds, dictionaries, depth, processes, concurrency or 16, rate_limit, base_url, page_store,
+                           offline)
+    elif concurrency:
+        concurrent_bfs_search(seeds, dictionaries, depth, concurrency, rate_limit, base_url, page_store, offline)
+    else:
+        bfs_search(seeds, dictionaries, depth, base_url, page_store, offline)
+    save_dictionaries(out, dictionaries)
+
+
+def copy_crawl_stage(out, directory, digest):
+    """Copies the files of an earlier crawl; digest is only there to key the stage by their contents"""
+    from WikiScraper import OUTPUT_FILES
+
+    for name in OUTPUT_FILES:
+        if os.path.exists(os.path.join(directory, name)):
+            shutil.copy(os.path.join(directory, name), os.path.join(out, name))
+
+
+def graph_stage(out, crawl):
+    from GraphStore import convert_json
+
+    convert_json(os.path.join(crawl, 'graph.json'), out)
+
+
+def stats_stage(out, graph, previous_graph=None, previous_stats=None):
+    """Computes the statistics of graph, warm-started from those of previous_graph in previous_stats if any
+
+    The warm start only changes how quickly the power iterations converge, not what they converge to, so the previous
+    run is not part of the key, and no other stage reads the statistics.
+    """
+    from GraphStore import load_graph
+    from GraphStats import STATS_DIR, compute_stats, save_stats, load_stats, graph_digest
+
+    start = None
+    if previous_graph and previous_stats and os.path.exists(os.path.join(previous_stats, STATS_DIR, 'meta.json')):
+        previous = load_graph(previous_graph)
+        if _load_json(os.path.join(previous_stats, STATS_DIR), 'meta.json')['graph'] == graph_digest(previous):
+            start = (previous.titles, load_stats(previous_stats, previous))
+    save_stats(compute_stats(load_graph(graph), start), out)
+
+
+def eigen_stage(out, graph, dim, method, tau, seed):
+    from GraphStore import load_graph
+    from ProjectAlgorithm import project_graph
+
+    np.save(os.path.join(out, 'evecs.npy'), project_graph(load_graph(graph), dim, method, tau, seed=seed))
+
+
+def clusters_stage(out, eigen, graph, crawl, dim, num_clusters, method, seed):
+    from GraphStore import load_graph
+    from ProjectAlgorithm import find_clusters, get_clusters
+
+    # The eigenvectors are in ascending order of eigenvalue, so the top dim are the last dim columns
+    points = np.ascontiguousarray(np.load(os.path.join(eigen, 'evecs.npy'), mmap_mode='r')[:, -dim:])
+    G = load_graph(graph)
+    labels, cluster_centers = find_clusters(points, G, _load_json(crawl, 'cats.json'), num_clusters, method, seed=seed)
+    np.save(os.path.join(out, 'labels.npy'), np.asarray(labels, dtype=np.int32))
+    _save_json(out, 'clusters.json', get_clusters(G.nodes, labels))
+    _save_json(out, 'cluster_centers.json', cluster_centers)
+
+
+def _positions(G, titles):
+    """The position in G of each of titles, or -1 for titles G does not have"""
+    index = {title: i for i, title in enumerate(G.titles)}
+    return np.array([index.get(title, -1) for title in titles], dtype=np.int64)
+
+
+def extend_stage(out, graph, previous_graph, previous_eigen, method, tau, previous):
+    """Places the nodes of graph missing from the projection of previous_graph into it; previous is only there to
+    key the stage by the previous results"""
+    from GraphStore import load_graph
+    from ProjectAlgorithm import extend_projection, projection_drift
+
+    G = load_graph(graph)
+    rows = _positions(G, load_graph(previous_graph).titles)
+    old = np.load(os.path.join(previous_eigen, 'evecs.npy'))
+    evecs = np.zeros((len(G), old.shape[1]))
+    known = np.zeros(len(G), dtype=bool)
+    evecs[rows[rows >= 0]] = old[rows >= 0]
+    known[rows[rows >= 0]] = True
+    evecs = extend_projection(G, evecs, known, tau, method)
+    np.save(os.path.join(out, 'evecs.npy'), evecs)
+    _save_json(out, 'drift.json', {'drift': projection_drift(G, evecs, tau), 'nodes': len(G),
+                                   'new_nodes': int((~known).sum())})
+
+
+def assign_stage(out, extend, graph, crawl, previous_graph, previous_clusters, dim, num_clusters, previous):
+    """Keeps the clusters of the nodes of previous_graph and puts each new node in the cluster with the nearest mean,
+    writing the same files as clusters_stage"""
+    from GraphStore import load_graph
+    from ProjectAlgorithm import cluster_means, assign_clusters, cluster_medoids, get_clusters
+
+    G = load_graph(graph)
+    rows = _positions(G, load_graph(previous_graph).titles)
+    old_labels = np.load(os.path.join(previous_clusters, 'labels.npy'))
+    labels = np.full(len(G), -1, dtype=np.int32)
+    labels[rows[rows >= 0]] = old_labels[rows >= 0]
+    points = np.ascontiguousarray(np.load(os.path.join(extend, 'evecs.npy'), mmap_mode='r')[:, -dim:])
+
+    known = labels >= 0
+    means, counts = cluster_means(points[known], labels[known], num_clusters)
+    clustered = np.flatnonzero(counts)
+    labels[~known] = clustered[assign_clusters(points[~known], means[clustered])]
+
+    category_dict = _load_json(crawl, 'cats.json')
+    nodes = list(G.nodes)
+    cluster_centers = {i: (nodes[idx], category_dict.get(nodes[idx]))
+                       for i, idx in enumerate(cluster_medoids(points, labels, num_clusters)) if idx >= 0}
+    np.save(os.path.join(out, 'labels.npy'), labels)
+    _save_json(out, 'clusters.json', get_clusters(nodes, labels))
+    _save_json(out, 'cluster_centers.json', cluster_centers)
+
+
+def categories_stage(out, clusters, crawl):
+    from ProjectAlgorithm import get_cluster_categories
+
+    _save_json(out, 'cluster_categories.json',
+               get_cluster_categories(_load_json(clusters, 'clusters.json'), _load_json(crawl, 'cats.json')))
+
+
+def names_stage(out, clusters, crawl, embeddings, digest):
+    from ProjectAlgorithm import count_cluster_tokens, get_cluster_names
+
+    cluster_dict = _load_json(clusters, 'clusters.json')
+    cluster_centers = _load_json(clusters, 'cluster_centers.json')
+    vocabulary, token_counts = count_cluster_tokens(cluster_dict, _load_json(crawl, 'cats.json'), cluster_centers)
+    cluster_names = get_cluster_names(cluster_dict, None, cluster_centers, token_counts, vocabulary, embeddings)
+    _save_json(out, 'cluster_names.json', {i: vector.tolist() for i, vector in cluster_names.items()})
+
+
+def cluster_graph_stage(out, clusters, graph):
+    from GraphStore import load_graph
+    from ProjectAlgorithm import make_cluster_graph, cluster_graph_dict
+
+    cluster_dict = _load_json(clusters, 'clusters.json')
+    C = make_cluster_graph(load_graph(graph), cluster_dict)
+    _save_json(out, 'community_graph_dict.json', cluster_graph_dict(C))
+    sizes = np.array([len(members) for members in cluster_dict.values()])
+    _save_json(out, 'stats.json', {
+        'nonempty_clusters': len(sizes),
+        'largest_cluster': int(sizes.max()),
+        'median_cluster': float(np.median(sizes)),
+        'singleton_clusters': int((sizes == 1).sum()),
+        'intra_cluster_edges': float(C.diagonal().sum() / max(C.sum(), 1)),
+    })
+
+
+def _run_stage(function, out, kwargs, manifest, metrics=False):
+    """Runs a stage into a temporary directory and moves it into place once it is complete
+
+    With metrics, the Instrument measurements made while the stage ran are saved with it as metrics.json
+    """
+    tmp = '%s.%d.tmp' % (out, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    if metrics:
+        Instrument.enable()
+        Instrument.reset()
+    start = time.time()
+    function(tmp, **kwargs)
+    manifest['seconds'] = time.time() - start
+    if metrics:
+        _save_json(tmp, 'metrics.json', Instrument.report())
+    _save_json(tmp, 'manifest.json', manifest)
+    try:
+        os.replace(tmp, out)
+    except OSError:
+        # Another run finished the same stage first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
+class _Inline:
+    """Stands in for the pool of processes when there is none, running each stage when it is submitted"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class Pipeline:
+    """Runs stages, reusing the results of those already in the cache
+
+    Parameters
+    ---------------
+    cache : str
+        The directory the results of the stages are kept in
+    processes : int or None
+        The number of stages run at once; defaults to the number of cpus, and 0 runs them one at a time in this process
+    metrics : bool
+        Whether the stages save their Instrument measurements as metrics.json
+    """
+
+    def __init__(self, cache='.pipeline', processes=None, metrics=False):
+        self.cache = cache
+        self.processes = processes
+        self.metrics = metrics
+        self._keys = dict()
+
+    def key(self, stage):
+        """The hash of a stage's name, parameters and the keys of its inputs"""
+        if id(stage) not in self._keys:
+            description = {'stage': stage.name, 'version': VERSION, 'params': stage.params,
+                           'inputs': {name: self.key(upstream) for name, upstream in sorted(stage.inputs.items())}}
+            self._keys[id(stage)] = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+        return self._keys[id(stage)]
+
+    def path(self, stage):
+        return os.path.join(self.cache, stage.name, self.key(stage)[:16])
+
+    def done(self, stage):
+        return os.path.exists(os.path.join(self.path(stage), 'manifest.json'))
+
+    def run(self, stages, log=sys.stderr):
+        """Runs every stage of stages, and those they depend on, that is not in the cache yet
+
+        The results of each stage are then in the directory self.path(stage)
+        """
+        pending = dict()
+        def collect(stage):
+            if id(stage) not in pending:
+                pending[id(stage)] = stage
+                for upstream in stage.inputs.values():
+                    collect(upstream)
+        for stage in stages:
+            collect(stage)
+
+        finished = {i for i, stage in pending.items() if self.done(stage)}
+        for i in finished:
+            print('%-13s %s cached' % (pending[i].name, self.key(pending[i])[:16]), file=log)
+        running = dict()
+        with _Inline() if self.processes == 0 else ProcessPoolExecutor(self.processes) as pool:
+            while len(finished) < len(pending):
+                for i, stage in pending.items():
+                    if i in finished or i in running.values():
+                        continue
+                    if all(id(upstream) in finished for upstream in stage.inputs.values()):
+                        kwargs = dict(stage.params, **stage.paths)
+                        kwargs.update({name: self.path(upstream) for name, upstream in stage.inputs.items()})
+                        manifest = {'stage': stage.name, 'key': self.key(stage), 'params': stage.params,
+                                    'inputs': {name: self.key(upstream) for name, upstream in stage.inputs.items()}}
+                        os.makedirs(os.path.dirname(self.path(stage)), exist_ok=True)
+                        future = pool.submit(_run_stage, stage.function, self.path(stage), kwargs, manifest, self.metrics)
+                        running[future] = i
+                        print('%-13s %s running' % (stage.name, self.key(stage)[:16]), file=log)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    i = running.pop(future)
+                    finished.add(i)
+                    print('%-13s %s done' % (pending[i].name, self.key(pending[i])[:16]), file=log)
+
+
+def downstream_stages(clusters, crawl, graph, embeddings=None, embeddings_digest=None):
+    """Returns the dictionary of the stages run on the results of a clusters stage, which it includes"""
+    stages = {'clusters': clusters,
+              'categories': Stage('categories', categories_stage, {}, {'clusters': clusters, 'crawl': crawl}),
+              'cluster_graph': Stage('cluster_graph', cluster_graph_stage, {}, {'clusters': clusters, 'graph': graph})}
+    if embeddings:
+        stages['names'] = Stage('names', names_stage, {'digest': embeddings_digest}, {'clusters': clusters, 'crawl': crawl},
+                                {'embeddings': os.path.abspath(embeddings)})
+    return stages
+
+
+def build_stages(args):
+    """Returns the crawl, graph, stats and eigen stages and, for each combination of dim and num_clusters, its
+    dictionary of stages"""
+    if args.crawl_dir:
+        from WikiScraper import OUTPUT_FILES
+        crawl = Stage('crawl', copy_crawl_stage,
+                      {'digest': directory_digest(args.crawl_dir, OUTPUT_FILES)}, {},
+                      {'directory': os.path.abspath(args.crawl_dir)})
+    else:
+        crawl = Stage('crawl', crawl_stage,
+                      {'seeds': args.seeds, 'depth': args.depth, 'base_url': args.base_url,
+                       'processes': args.crawl_processes, 'concurrency': args.concurrency, 'rate_limit': args.rate_limit,
+                       'offline': args.offline}, {}, {'store': os.path.abspath(args.store) if args.store else None})
+    base = _load_json(args.cache, 'base.json') if os.path.exists(os.path.join(args.cache, 'base.json')) else dict()
+    graph = Stage('graph', graph_stage, {}, {'crawl': crawl})
+    stats = Stage('stats', stats_stage, {}, {'graph': graph},
+                  {'previous_graph': base.get('graph'), 'previous_stats': base.get('stats')})
+    eigen = Stage('eigen', eigen_stage, {'dim': max(args.dim), 'method': args.eigen_method, 'tau': args.tau,
+                                         'seed': args.seed}, {'graph': graph})
+    if args.embeddings:
+        args.embeddings_digest = directory_digest(args.embeddings, ['vocab.json', 'vectors.npy'])
+
+    combinations = dict()
+    for dim, num_clusters in itertools.product(args.dim, args.clusters):
+        clusters = Stage('clusters', clusters_stage, {'dim': dim, 'num_clusters': num_clusters,
+                                                      'method': args.cluster_method, 'seed': args.seed},
+                         {'eigen': eigen, 'graph': graph, 'crawl': crawl})
+        combinations[dim, num_clusters] = downstream_stages(clusters, crawl, graph, args.embeddings,
+                                                            getattr(args, 'embeddings_digest', None))
+    return crawl, graph, stats, eigen, combinations
+
+
+def incremental_stages(pipeline, args, crawl, graph, combinations):
+    """Places the nodes added to the graph since the last run that computed the projection into its projection and
+    clusters, rather than recomputing them
+
+    The extend stage is run at once, and if the drift of the extended projection is within --drift-threshold, the
+    extend stage and, for each combination, an assign stage and the stages run on its clusters are returned in place
+    of the eigen stage and combinations; otherwise, or if that run did not compute every combination asked for,
+    the eigen stage and combinations are returned unchanged, so that everything is recomputed.
+    """
+    if not os.path.exists(os.path.join(args.cache, 'base.json')):
+        print('No earlier run to update; computing the projection', file=sys.stderr)
+        return None, combinations
+    base = _load_json(args.cache, 'base.json')
+    missing = [c for c in combinations if '%d,%d' % c not in base['clusters']]
+    if base['columns'] < max(args.dim) or missing:
+        print('The base run did not compute every dim and number of clusters asked for; computing the projection',
+              file=sys.stderr)
+        return None, combinations
+
+    key = lambda directory: _load_json(directory, 'manifest.json')['key']
+    extend = Stage('extend', extend_stage,
+                   {'method': args.extension, 'tau': args.tau, 'previous': [key(base['graph']), key(base['eigen'])]},
+                   {'graph': graph}, {'previous_graph': base['graph'], 'previous_eigen': base['eigen']})
+    pipeline.run([extend])
+    drift = _load_json(pipeline.path(extend), 'drift.json')
+    print('Placed %d new nodes of %d with drift %.4f' % (drift['new_nodes'], drift['nodes'], drift['drift']),
+          file=sys.stderr)
+    if drift['drift'] > args.drift_threshold:
+        print('The drift is above %g; computing the projection' % args.drift_threshold, file=sys.stderr)
+        return None, combinations
+
+    updated = dict()
+    for (dim, num_clusters) in combinations:
+        previous = base['clusters']['%d,%d' % (dim, num_clusters)]
+        assign = Stage('assign', assign_stage, {'dim': dim, 'num_clusters': num_clusters, 'previous': key(previous)},
+                       {'extend': extend, 'graph': graph, 'crawl': crawl},
+                       {'previous_graph': base['graph'], 'previous_clusters': previous})
+        updated[dim, num_clusters] = downstream_stages(assign, crawl, graph, args.embeddings,
+                                                       getattr(args, 'embeddings_digest', None))
+    return extend, updated
+
+
+def export_app(pipeline, crawl, stages, app):
+    """Copies the files the App serves into its directory"""
+    files = [(crawl, 'cats.json', 'category_dict.json'), (crawl, 'titlelink.json', 'titlelink.json'),
+             (stages['clusters'], 'clusters.json', 'clusters.json'),
+             (stages['clusters'], 'cluster_centers.json', 'cluster_centers.json'),
+             (stages['categories'], 'cluster_categories.json', 'cluster_categories.json'),
+             (stages['cluster_graph'], 'community_graph_dict.json', 'community_graph_dict.json')]
+    if 'names' in stages:
+        files.append((stages['names'], 'cluster_names.json', 'cluster_names.json'))
+    os.makedirs(app, exist_ok=True)
+    for stage, name, target in files:
+        path = os.path.join(pipeline.path(stage), name)
+        if os.path.exists(path):
+            shutil.copy(path, os.path.join(app, target))
+
+
+def save_metrics(pipeline, stages, path):
+    """Gathers the metrics.json of stages into path, in the order given; stages found in the cache keep the
+    measurements of the run that computed them"""
+    metrics, seen = [], set()
+    for stage in stages:
+        directory = pipeline.path(stage)
+        if directory in seen or not os.path.exists(os.path.join(directory, 'metrics.json')):
+            continue
+        seen.add(directory)
+        metrics.append({'stage': stage.name, 'key': pipeline.key(stage),
+                        'seconds': _load_json(directory, 'manifest.json')['seconds'],
+                        'metrics': _load_json(directory, 'metrics.json')})
+    with open(path, 'w') as f:
+        json.dump(metrics, f, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the analysis from the crawl to the App, caching every stage')
+    crawl = parser.add_mutually_exclusive_group(required=True)
+    crawl.add_argument('--crawl-dir', help='use the graph.json, titlelink.json and cats.json of an earlier crawl')
+    crawl.add_argument('--seeds', nargs='+', help='crawl outward from these links, e.g. wiki/Gupta_Empire')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--base-url', default='https://en.wikipedia.org/')
+    parser.add_argument('--crawl-processes', type=int, default=0, help='split the crawl across this many processes')
+    parser.add_argument('--concurrency', type=int, default=0)
+    parser.add_argument('--rate-limit', type=float)
+    parser.add_argument('--store', help='SQLite page store to crawl through')
+    parser.add_argument('--offline', action='store_true')
+    parser.add_argument('--dim', type=int, nargs='+', default=[10], help='dimensions of the projection to try')
+    parser.add_argument('--clusters', type=int, nargs='+', default=[1000], help='numbers of clusters to try')
+    parser.add_argument('--eigen-method', default='eigsh', choices=['eigsh', 'lobpcg', 'randomized'])
+    parser.add_argument('--tau', type=float, default=None)
+    parser.add_argument('--cluster-method', default='kmeans', choices=['kmeans', 'minibatch'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--incremental', action='store_true',
+                        help='place new nodes into the projection and clusters of the last run instead of recomputing them')
+    parser.add_argument('--extension', default='nystrom', choices=['nystrom', 'harmonic'],
+                        help='how --incremental places new nodes')
+    parser.add_argument('--drift-threshold', type=float, default=0.02,
+                        help='with --incremental, recompute the projection when its drift is above this')
+    parser.add_argument('--embeddings', help='the word vector subset exported by Embeddings.py, to name clusters')
+    parser.add_argument('--cache', default='.pipeline', help='the directory stage results are cached in')
+    parser.add_argument('--processes', type=int, default=None, help='the number of stages to run at once')
+    parser.add_argument('--app', help='copy the results into this App directory; needs a single dim and number of clusters')
+    parser.add_argument('--metrics', help='gather the measurements of the stages run into this json file')
+    parser.add_argument('--profile', help='profile the run into this file; runs every stage in this process')
+    parser.add_argument('--profile-mode', default='cprofile', choices=['cprofile', 'sampling'])
+    args = parser.parse_args(argv)
+    if args.app and len(args.dim) * len(args.clusters) > 1:
+        parser.error('--app needs a single --dim and --clusters')
+
+    crawl, graph, stats, eigen, combinations = build_stages(args)
+    pipeline = Pipeline(args.cache, 0 if args.profile else args.processes, bool(args.metrics))
+    extend = None
+    with Instrument.profile(args.profile, args.profile_mode) if args.profile else contextlib.nullcontext():
+        if args.incremental:
+            extend, combinations = incremental_stages(pipeline, args, crawl, graph, combinations)
+        pipeline.run([stats] + [stage for stages in combinations.values() for stage in stages.values()])
+    if extend is None:
+        _save_json(args.cache, 'base.json', {
+            'graph': os.path.abspath(pipeline.path(graph)), 'stats': os.path.abspath(pipeline.path(stats)),
+            'eigen': os.path.abspath(pipeline.path(eigen)),
+            'columns': max(args.dim),
+            'clusters': {'%d,%d' % combination: os.path.abspath(pipeline.path(stages['clusters']))
+                         for combination, stages in combinations.items()}})
+
+    if args.app:
+        export_app(pipeline, crawl, next(iter(combinations.values())), args.app)
+    if len(combinations) > 1:
+        sweep = []
+        for (dim, num_clusters), stages in combinations.items():
+            result = {'dim': dim, 'num_clusters': num_clusters}
+            result.update({name: pipeline.path(stage) for name, stage in stages.items()})
+            result.update(_load_json(pipeline.path(stages['cluster_graph']), 'stats.json'))
+            sweep.append(result)
+        _save_json(args.cache, 'sweep.json', sweep)
+        print('Sweep results in %s' % os.path.join(args.cache, 'sweep.json'), file=sys.stderr)
+    if args.metrics:
+        save_metrics(pipeline, [crawl, graph, stats, eigen] + ([extend] if extend else []) +
+                     [stage for stages in combinations.values() for stage in stages.values()], args.metrics)
+
+
+if __name__ == '__main__':
+    main()
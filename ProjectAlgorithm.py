@@ -1,20 +1,103 @@
 import numpy as np
 import scipy as sp
+import scipy.sparse
+import scipy.sparse.linalg
 import networkx as nx
 import pylab as pylab
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import pairwise_distances_argmin_min
 import matplotlib as mpl
 import json
 import scipy.linalg.interpolative as sli
-import functools
+import itertools
+from collections import Counter
 from gensim.test.utils import common_texts
 from gensim.models import Word2Vec
 import gensim.downloader as api
-from gensim.parsing.preprocessing import remove_stopwords
+from GraphStore import CSRGraph
+from Embeddings import tokenize, load_embeddings
+from Instrument import stage
 
+try:
+    import pyamg
+except ImportError:
+    pyamg = None
 
-def project_graph(G, dim, condition = None):
+
+def adjacency_matrix(G):
+    """Returns the adjacency matrix of a graph as a scipy CSR matrix
+    
+    Parameters
+    ---------------
+    G : NetworkX graph, GraphStore.CSRGraph or scipy sparse matrix
+        The graph; a CSRGraph loaded with GraphStore.load_graph skips building a NetworkX graph altogether
+
+    Returns
+    ---------------
+    A : scipy.sparse.csr_matrix
+        The adjacency matrix, with rows and columns in the order of G.nodes
+    """
+    if sp.sparse.issparse(G):
+        return sp.sparse.csr_matrix(G)
+    if isinstance(G, CSRGraph):
+        return G.adjacency()
+    return sp.sparse.csr_matrix(nx.adjacency_matrix(G))
+
+
+def normalized_adjacency(A, tau=0):
+    """Returns the symmetric normalized adjacency matrix D^{-1/2} A D^{-1/2} of a graph, along with D^{-1/2}
+    
+    With tau > 0 this is the regularized version, with tau added to every degree: the matrix is then 
+    D_tau^{-1/2} (A + (tau/n) 11^T) D_tau^{-1/2}, i.e. the graph gets a light edge of weight tau/n between every pair of nodes, which 
+    joins up its disconnected components. It is returned as a LinearOperator, since the dense rank-one term is never formed. With 
+    tau = 0, isolated nodes have degree 0, and their rows and columns are left at zero rather than dividing by zero.
+
+    Parameters
+    ---------------
+    A : scipy sparse matrix
+        The symmetric adjacency matrix of the graph
+    tau : float
+        The degree regularization
+
+    Returns
+    ---------------
+    M : scipy.sparse.csr_matrix or scipy.sparse.linalg.LinearOperator
+        The normalized adjacency matrix; a LinearOperator when tau > 0
+    d_inv_sqrt : Array
+        The diagonal of D^{-1/2} (or D_tau^{-1/2}), with zeros for isolated nodes
+    """
+    n = A.shape[0]
+    degrees = np.asarray(A.sum(axis=1)).ravel() + tau
+    d_inv_sqrt = np.zeros(n)
+    d_inv_sqrt[degrees > 0] = 1 / np.sqrt(degrees[degrees > 0])
+    D = sp.sparse.diags(d_inv_sqrt)
+    M = sp.sparse.csr_matrix(D @ A @ D)
+    if not tau:
+        return M, d_inv_sqrt
+
+    c = tau / n
+    def matmat(X):
+        return M @ X + c * np.outer(d_inv_sqrt, d_inv_sqrt @ X).reshape(X.shape)
+    return sp.sparse.linalg.LinearOperator((n, n), matvec=matmat, matmat=matmat, rmatvec=matmat, dtype=np.float64), d_inv_sqrt
+
+
+def _randomized_eigh(M, dim, n_iter, rng):
+    """The top dim eigenpairs of a symmetric operator with eigenvalues in [-1, 1], by randomized subspace iteration on the positive 
+    semi-definite M + I followed by a Rayleigh-Ritz step; the basis is re-orthonormalized by Cholesky QR, which is much cheaper than 
+    Householder QR for tall, thin blocks"""
+    n = M.shape[0]
+    Q = np.linalg.qr(rng.standard_normal((n, 2 * dim)))[0]
+    for _ in range(n_iter):
+        X = M @ Q + Q
+        R = np.linalg.cholesky(X.T @ X)
+        Q = np.linalg.solve(R, X.T).T
+    Q = np.linalg.qr(Q)[0]
+    evals, V = np.linalg.eigh(Q.T @ (M @ Q))
+    return evals[-dim:], Q @ V[:, -dim:]
+
+
+@stage(items=lambda evecs, *args, **kwargs: len(evecs))
+def project_graph(G, dim, method='eigsh', tau=None, tol=0, seed=None, amg=False, n_iter=60):
     """A function to project a graph into a set of points in dim-dimensional space. These points can then be clustered later.
     
     We use the normalized, random-walk Laplacian (aka transition matrix) of the graph as that generally has better properties--we can search
@@ -28,39 +111,194 @@ def project_graph(G, dim, condition = None):
     By find the top dim eigenvectors of T, we are equivalently then finding the bottom dim weighted eigenvectors of L, and if these eigenvectors
     are v_i, with entries v_{ij}, we map node j to the vector (v_{ij})_{i=1}^dim.
 
+    T itself is not symmetric, so rather than handing it to a symmetric solver we use the similar matrix M = D^{-1/2} A D^{-1/2} = D^{1/2} T D^{-1/2}:
+    it has the same eigenvalues, all in [-1, 1], and if Mu = lambda u then T(D^{-1/2}u) = lambda D^{-1/2}u. We find the top dim eigenvectors u_i 
+    of M and return v_i = D^{-1/2}u_i.
+
+    A crawled graph is rarely connected (graph.json has 271 components), and every component contributes an eigenvalue of exactly 1, so the top
+    eigenvectors of T would only tell the small components apart, and the solver would crawl through the degenerate eigenspace. So by default the 
+    graph is regularized as in normalized_adjacency, with tau the average degree: the walk then teleports to a random node with a probability 
+    that is small for well-connected nodes, the top eigenvalue is simple, the rest are well separated, and isolated nodes are handled too.
+
     Parameters
     -------------------------------
-    G : A NetworkX graph
+    G : A NetworkX graph, GraphStore.CSRGraph or scipy sparse adjacency matrix
         The input graph for which we want to do the analysis 
     dim : int 
         The dimension of the vector space to project the points to. 
-    
+    method : str
+        The eigensolver: 'eigsh' (Lanczos, the default), 'lobpcg' (block solver) or 'randomized' (randomized subspace iteration); the 
+        last two work on the whole block of dim vectors at once, which suits graphs with millions of nodes. 'randomized' is approximate,
+        and needs more iterations the closer together the top eigenvalues are
+    tau : float or None
+        The degree regularization; None means the average degree, and 0 means the unregularized transition matrix, in which case 
+        isolated nodes are mapped to the origin
+    tol : float
+        The tolerance of the eigensolver; 0 means machine precision for 'eigsh', and the solver's default for 'lobpcg'
+    seed : int or None
+        Seeds the starting vectors, so that the projection is reproducible
+    amg : bool
+        With 'lobpcg', precondition with algebraic multigrid (requires pyamg); this pays off on mesh-like graphs, less so on scale-free ones
+    n_iter : int
+        The number of subspace iterations of 'randomized'
 
     Returns 
     --------------------------------
     evecs: Array
-         The eigenvectors corresponding to the (dim)-largest eigenvalues of the transition matrix of the graph
+         The eigenvectors corresponding to the (dim)-largest eigenvalues of the transition matrix of the graph, as an n x dim array in 
+         ascending order of eigenvalue
     """
-    n = len(G.nodes)
-    A = nx.adj_matrix(G) 
-    D_inv = sp.sparse.csr_matrix(sp.sparse.spdiags([float(i) for i in 1/A.sum(axis=1)], 0, n, n))
-    T = D_inv*A
-    T = sp.sparse.csr_matrix(T)
-    try:
-        evals, evecs = sp.sparse.linalg.eigsh(T, dim)
+    A = adjacency_matrix(G).astype(np.float64)
+    n = A.shape[0]
+    if tau is None:
+        tau = A.sum() / n
+    M, d_inv_sqrt = normalized_adjacency(A, tau)
+    rng = np.random.default_rng(seed)
 
-    
-    except RuntimeError or RuntimeWarning:
-        if not condition:
-            condition = 10**(-8)
-            T += condition * sp.eye(n)
-            evals, evecs = sp.sparse.linalg.eigsh(T, dim)
-        
-    return evecs
+    if method == 'eigsh':
+        evals, evecs = sp.sparse.linalg.eigsh(M, dim, which='LA', tol=tol, v0=rng.random(n))
+
+    elif method == 'lobpcg':
+        # The largest eigenvalues of M are the smallest of the positive semi-definite I - M
+        I = sp.sparse.identity(n, format='csr')
+        L = sp.sparse.linalg.aslinearoperator(I) - sp.sparse.linalg.aslinearoperator(M)
+        preconditioner = None
+        if amg:
+            if pyamg is None:
+                raise ImportError('amg=True requires pyamg')
+            # The sparse part of I - M is positive definite when tau > 0, and nearly singular along the components when tau = 0
+            D = sp.sparse.diags(d_inv_sqrt)
+            preconditioner = pyamg.smoothed_aggregation_solver(sp.sparse.csr_matrix(I - D @ A @ D + 1e-8 * I)).aspreconditioner()
+        evals, evecs = sp.sparse.linalg.lobpcg(L, rng.random((n, dim)), M=preconditioner, tol=tol or None, largest=False, maxiter=500)
+        order = np.argsort(1 - evals)
+        evals, evecs = 1 - evals[order], evecs[:, order]
+
+    elif method == 'randomized':
+        evals, evecs = _randomized_eigh(M, dim, n_iter, rng)
+
+    else:
+        raise ValueError("method must be one of 'eigsh', 'lobpcg' or 'randomized', not %r" % method)
+
+    return evecs * d_inv_sqrt[:, None]
+
+def _regularized_product(A, V, tau):
+    """Returns (A + (tau/n) 11^T) V, the product with the regularized adjacency matrix of normalized_adjacency, and the regularized degrees"""
+    n = A.shape[0]
+    return A @ V + (tau / n) * V.sum(axis=0), np.asarray(A.sum(axis=1)).ravel() + tau
+
+def projection_eigenvalues(G, evecs, tau=None):
+    """Returns the eigenvalue of the transition matrix of G that each column of evecs, like the output of project_graph, belongs to, as its
+    Rayleigh quotient v^T A_tau v / v^T D_tau v
 
+    Parameters
+    ---------------
+    G : A NetworkX graph, GraphStore.CSRGraph or scipy sparse adjacency matrix
+        The graph evecs is the projection of
+    evecs : Array
+        An n x dim array of eigenvectors, in the order of G.nodes
+    tau : float or None
+        The degree regularization, as in project_graph; defaults to the average degree of G
+    """
+    A = adjacency_matrix(G).astype(np.float64)
+    tau = A.sum() / A.shape[0] if tau is None else tau
+    V = np.asarray(evecs, dtype=np.float64)
+    AV, degrees = _regularized_product(A, V, tau)
+    return (V * AV).sum(axis=0) / (degrees[:, None] * V * V).sum(axis=0)
+
+def projection_drift(G, evecs, tau=None):
+    """Measures how far evecs is from being the projection project_graph would compute for G, e.g. after new nodes have been placed in it
+    with extend_projection
+
+    The drift is the largest relative residual ||M u - lambda u|| / ||u|| over the columns, where M is the symmetric normalized adjacency
+    matrix of G that project_graph finds the eigenvectors u = D^{1/2} v of, and lambda the Rayleigh quotient of u; it is next to zero for
+    the output of project_graph itself, and grows as the graph moves away from the one the projection was computed on.
+
+    Parameters
+    ---------------
+    G : A NetworkX graph, GraphStore.CSRGraph or scipy sparse adjacency matrix
+        The current graph
+    evecs : Array
+        An n x dim array of eigenvectors, in the order of G.nodes
+    tau : float or None
+        The degree regularization, as in project_graph; defaults to the average degree of G
+
+    Returns
+    ---------------
+    drift : float
+        The largest relative residual of the columns of evecs
+    """
+    A = adjacency_matrix(G).astype(np.float64)
+    tau = A.sum() / A.shape[0] if tau is None else tau
+    V = np.asarray(evecs, dtype=np.float64)
+    AV, degrees = _regularized_product(A, V, tau)
+    evals = (V * AV).sum(axis=0) / (degrees[:, None] * V * V).sum(axis=0)
+    d_sqrt = np.sqrt(degrees)[:, None]
+    residuals = np.linalg.norm(AV / d_sqrt - evals * d_sqrt * V, axis=0) / np.linalg.norm(d_sqrt * V, axis=0)
+    return float(residuals.max())
+
+@stage(items=lambda result, G, evecs, known, *args, **kwargs: int((~np.asarray(known, dtype=bool)).sum()))
+def extend_projection(G, evecs, known, tau=None, method='nystrom'):
+    """Places the nodes of G that are not in the projection evecs yet, e.g. the pages added by an incremental crawl, without recomputing
+    the eigenvectors
+
+    If v is an eigenvector of the regularized transition matrix with eigenvalue lambda, each entry satisfies
+    lambda (d_i + tau) v_i = sum_j A_ij v_j + (tau/n) sum_j v_j. The Nystrom extension takes these equations for the new nodes only, holding the
+    entries of the known nodes fixed, and solves the sparse system they form, so new nodes linked to each other are placed together; the
+    harmonic extension does the same with lambda = 1, placing every new node at the weighted mean of its neighbours. The eigenvalues come
+    from the Rayleigh quotients of evecs on the graph of the known nodes, and the teleportation term counts the known nodes only.
+    The known nodes keep their coordinates, so the clusters found from them stay valid; projection_drift tells when the projection should
+    be recomputed instead.
+
+    Parameters
+    ---------------
+    G : A NetworkX graph, GraphStore.CSRGraph or scipy sparse adjacency matrix
+        The graph, new nodes included
+    evecs : Array
+        An n x dim array in the order of G.nodes, whose rows for the known nodes hold their projection; the other rows are ignored
+    known : Array
+        A boolean mask of the nodes that have been projected already
+    tau : float or None
+        The degree regularization the projection was computed with; defaults to the average degree of the graph of the known nodes,
+        which is what project_graph used if that was the whole graph
+    method : str
+        'nystrom' or 'harmonic'
+
+    Returns
+    ---------------
+    evecs : Array
+        A copy of evecs, with the rows of the new nodes filled in
+    """
+    A = adjacency_matrix(G).astype(np.float64)
+    n = A.shape[0]
+    known = np.asarray(known, dtype=bool)
+    old, new = np.flatnonzero(known), np.flatnonzero(~known)
+    V = np.array(evecs, dtype=np.float64)
+    if not len(new):
+        return V
+    A_known = A[old][:, old]
+    tau = A_known.sum() / len(old) if tau is None else tau
+    if method == 'nystrom':
+        evals = projection_eigenvalues(A_known, V[old], tau)
+    elif method == 'harmonic':
+        evals = np.ones(V.shape[1])
+    else:
+        raise ValueError("method must be 'nystrom' or 'harmonic', not %r" % method)
+
+    A_new = A[new]
+    rhs = A_new[:, old] @ V[old] + (tau / n) * V[old].sum(axis=0)
+    degrees = np.asarray(A_new.sum(axis=1)).ravel() + tau
+    links = A_new[:, new]
+    for k, lam in enumerate(evals):
+        system = sp.sparse.csc_matrix(sp.sparse.diags(lam * degrees) - links)
+        V[new, k] = sp.sparse.linalg.spsolve(system, rhs[:, k])
+    return V
+
+@stage(items=lambda clusters, nodes, labels: len(labels))
 def get_clusters(nodes, labels):
     """Returns a dictionary of cluster labels as keys with values the list of associated nodes in that cluster
     
+    The nodes are grouped with a single stable argsort of the labels, so each list keeps the order of nodes.
+
     Parameters
     ---------------------
 
@@ -75,7 +313,29 @@ def get_clusters(nodes, labels):
         A dictionary of the labels output from k-means clustering as keys, with a list ofthe nodes of the graph 
         in the associated cluster as the values
     """
-    return {j: list(np.array(nodes)[[i == j for i in labels]]) for j in set(labels)}
+    nodes = list(nodes)
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    return {int(labels[group[0]]): [nodes[i] for i in group] for group in np.split(order, boundaries) if len(group)}
+
+
+def cluster_labels(nodes, clusters):
+    """The inverse of get_clusters: returns the array of cluster labels of nodes, in order, with -1 for nodes in no cluster
+    
+    Parameters
+    ---------------------
+    nodes : NetworkX nodes object or List
+            Usually will be G.nodes for the original graph
+    clusters : Dict
+            A dictionary like the output of get_clusters
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    labels = np.full(len(index), -1)
+    for k, members in clusters.items():
+        labels[[index[node] for node in members]] = int(k)
+    return labels
 
 
 def get_cluster_categories(clusters, category_dict):
@@ -95,82 +355,286 @@ def get_cluster_categories(clusters, category_dict):
         A dictionary whose keys are the cluster labels, and values are all the categories corresponding to nodes
         within that cluster
     """
-    return  {j: functools.reduce(lambda x, y: x + y, (category_dict[k] if k in category_dict else [] for k in clusters[j])) for j in clusters}
+    return {j: list(itertools.chain.from_iterable(category_dict.get(k, []) for k in clusters[j])) for j in clusters}
+
+def count_tokens(phrases, vocabulary):
+    """Counts the words of a stream of phrases as interned token ids
+
+    Parameters
+    ---------------
+    phrases : iterable of str
+        Category names, titles, or anything else to split into words
+    vocabulary : Dict
+        A dictionary from words to token ids; words seen for the first time are added to it
+
+    Returns
+    ---------------
+    counts : Counter
+        The number of times each token id occurs
+    """
+    return Counter(vocabulary.setdefault(word, len(vocabulary)) for word in tokenize(phrases))
+
+@stage(items=lambda result, *args, **kwargs: sum(map(len, result[1].values())))
+def count_cluster_tokens(clusters, category_dict, cluster_centers=None, vocabulary=None):
+    """Counts the words naming each cluster: the categories of its nodes, its titles, and the categories of its center
+
+    The categories are streamed from category_dict node by node, so no cluster-sized list of categories is ever built,
+    and words are interned to token ids shared by all clusters.
 
-def get_cluster_names(clusters, cluster_categories, cluster_centers):
+    Parameters
+    ---------------
+    clusters : Dict
+        A dictionary like the output of get_clusters, keyed by cluster indices and valued with lists of nodes in the cluster
+    category_dict : Dict
+        A dictionary keyed by nodes, and valued with lists of all categories associated to each node
+    cluster_centers : Dict or None
+        A dictionary like the second output of find_clusters; the categories of each center count once more
+    vocabulary : Dict or None
+        A dictionary from words to token ids to extend, e.g. from a previous call
+
+    Returns
+    ---------------
+    vocabulary : Dict
+        A dictionary from every word counted to its token id
+    token_counts : Dict
+        A dictionary whose keys are the cluster labels, and values are Counters of token ids
+    """
+    vocabulary = dict() if vocabulary is None else vocabulary
+    cluster_centers = cluster_centers or dict()
+    token_counts = dict()
+    for i in clusters:
+        phrases = itertools.chain(itertools.chain.from_iterable(category_dict.get(k, []) for k in clusters[i]), clusters[i])
+        if i in cluster_centers and cluster_centers[i][1]:
+            phrases = itertools.chain(phrases, cluster_centers[i][1])
+        token_counts[i] = count_tokens(phrases, vocabulary)
+    return vocabulary, token_counts
+
+def count_cluster_categories(clusters, category_dict):
+    """Returns a dictionary whose keys are the cluster labels, and values are Counters of the categories of nodes in that
+    cluster; the counting equivalent of get_cluster_categories"""
+    return {j: Counter(itertools.chain.from_iterable(category_dict.get(k, []) for k in clusters[j])) for j in clusters}
+
+def top_counts(counts, n=10, vocabulary=None):
+    """Returns the n most frequent items of each cluster's Counter, most frequent first
+
+    Parameters
+    ---------------
+    counts : Dict
+        A dictionary of Counters, like the output of count_cluster_categories or the second output of count_cluster_tokens
+    n : int
+        The number of items to keep for each cluster
+    vocabulary : Dict or None
+        If given, the vocabulary the counts were interned with, to turn token ids back into words
+
+    Returns
+    ---------------
+    top : Dict
+        A dictionary whose keys are the cluster labels, and values are lists of (item, count) pairs
+    """
+    words = list(vocabulary) if vocabulary is not None else None
+    return {j: [(words[item] if words is not None else item, count) for item, count in counts[j].most_common(n)]
+            for j in counts}
+
+@stage(items=lambda cluster_names, *args, **kwargs: len(cluster_names))
+def get_cluster_names(clusters, cluster_categories, cluster_centers, token_counts=None, vocabulary=None, embeddings=None):
     """A function to use word2vec to look at the cluster categories and try and name each cluster
     
     Parameters
     ----------------------
     clusters: Dict
             A dictionary like the output of get_clusters, keyed by cluster_indices and valued with lists of nodes in the cluster
+    cluster_categories : Dict
+            A dictionary like the output of get_cluster_categories; not needed if token_counts is given
     cluster_centeres: Dict
             A dictionary like the second output of find_clusters, with the most central cluster from the kmeans algorithm as the representative
             of each cluster
-
-    Uses gensim's pre-trained glove-wiki-gigaword-300 word2vec model to find a word2vec vector to name each cluster
+    token_counts, vocabulary : Dict or None
+            The output of count_cluster_tokens, if it has already been computed; they are given together, as the
+            token ids of token_counts mean nothing without the vocabulary they were interned with
+    embeddings : Embeddings, gensim KeyedVectors, str or None
+            The word vectors, or the directory of a subset exported with Embeddings.py; if None, gensim's pre-trained
+            glove-wiki-gigaword-300 model is loaded in full
 
     Returns
     --------------------
     cluster_names : Dict
         A dictionary whose keys are cluster labels, and values are a word2vec vector that is the average vector of 
-        all the categories corresponding to nodes in that cluster
+        all the categories corresponding to nodes in that cluster; clusters with no words known to the model get
+        the zero vector
     """
-    
+    if (token_counts is None) != (vocabulary is None):
+        raise ValueError('token_counts and vocabulary must be given together, as count_cluster_tokens returns them')
+    if token_counts is None:
+        vocabulary = dict()
+        token_counts = dict()
+        for i in cluster_categories:
+            phrases = itertools.chain(cluster_categories[i], clusters[i])
+            if i in cluster_centers and cluster_centers[i][1]:
+                phrases = itertools.chain(phrases, cluster_centers[i][1])
+            token_counts[i] = count_tokens(phrases, vocabulary)
+
+    if embeddings is None:
+        embeddings = api.load("glove-wiki-gigaword-300")
+    elif isinstance(embeddings, str):
+        embeddings = load_embeddings(embeddings)
+
+    # The row of the vectors for each token id, or -1 for words the model does not know
+    rows = np.fromiter((embeddings.key_to_index.get(word, -1) for word in vocabulary), dtype=np.int64, count=len(vocabulary))
+
     cluster_names = dict()
-    model = api.load("glove-wiki-gigaword-300")
-    
-    for i in cluster_categories:
-        words = ([word.lower() for cat in cluster_categories[i] for word in cat.split(' ')]
-                    + [word.lower() for title in clusters[i] for word in title.split(' ')])
-        if i in cluster_centers and cluster_centers[i][1]:
-            words += [word.lower() for cat in cluster_centers[i][1] for word in cat.split(' ')] 
-        
-        words = remove_stopwords(' '.join(words)).split(' ')
-        avg_vect = np.zeros(300)
-        count = 0
-        
-        for word in words:
-            try:
-                avg_vect += model.get_vector(word)
-                count += 1
-            except KeyError:
-                pass
-            
-        
-        avg_vect /= count
-        cluster_names[i] = avg_vect
+    for i, counts in token_counts.items():
+        tokens = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        token_rows = rows[tokens]
+        known = token_rows >= 0
+        if known.any():
+            cluster_names[i] = weights[known] @ embeddings.vectors[token_rows[known]] / weights[known].sum()
+        else:
+            cluster_names[i] = np.zeros(embeddings.vectors.shape[1])
 
     return cluster_names
 
+def cluster_adjacency(A, labels, num_clusters):
+    """Collapses a graph onto its clusters: entry (i, j) of the result counts the edges between clusters i and j
+    
+    This is one sparse product P^T A P, where P is the n x num_clusters indicator matrix of the labels.
+
+    Parameters
+    ---------------
+    A : scipy sparse matrix
+        The adjacency matrix of the original graph
+    labels : Array
+        The cluster label of each node, in range(num_clusters); nodes labelled -1 are left out
+    num_clusters : int
+        The number of clusters
+
+    Returns
+    ---------------
+    C : scipy.sparse.csr_matrix
+        The num_clusters x num_clusters weighted adjacency matrix of the cluster multigraph
+    """
+    labels = np.asarray(labels)
+    rows = np.flatnonzero(labels >= 0)
+    P = sp.sparse.csr_matrix((np.ones(len(rows)), (rows, labels[rows])), shape=(len(labels), num_clusters))
+    return sp.sparse.csr_matrix(P.T @ A @ P)
+
+
+@stage(items=lambda C, G, clusters: len(G.nodes))
 def make_cluster_graph(G, clusters):
     """Makes a new graph of the connectivity between clusters, based on the original graph G, and the clusters.
     
     Parameters
     ---------------
-    G : NetworkX graph
+    G : NetworkX graph or GraphStore.CSRGraph
         The original graph from which the clusters derive
     clusters : Dict
         The dictionary whose keys are cluster indices and values are lists of all nodes in each cluster
 
     Returns
     ----------------
-    new_G : Dict
-        A dictionary representation of the multigraph, with keys being cluster labels, and values are lists of
-        all neighbouring cluster labels
+    new_G : scipy.sparse.csr_matrix
+        The weighted adjacency matrix of the multigraph, with an edge between a pair of clusters for each edge between pairs of pages with 
+        one page in each cluster; the multiplicity of each edge is its weight. As in the undirected graph, an edge within cluster i counts
+        twice towards entry (i, i). cluster_graph_dict turns it back into the dictionary of lists stored in community_graph.json
     """
+    A = adjacency_matrix(G)
+    # A self-loop is a single entry of A, but, like any other edge within a cluster, counts twice
+    A = A + sp.sparse.diags(A.diagonal())
+    num_clusters = max(int(k) for k in clusters) + 1
+    return cluster_adjacency(A, cluster_labels(G.nodes, clusters), num_clusters)
+
 
-    new_G = {i : [] for i in range(len(clusters))}
-    for node1, node2 in G.edges:
-        i = [node1 in clusters[k] for k in clusters].index(True)
-        j = [node2 in clusters[k] for k in clusters].index(True)
-        new_G[i].append(j)
-        new_G[j].append(i)
+def cluster_graph_dict(cluster_graph):
+    """Expands the weighted cluster graph from make_cluster_graph into a dictionary representation of the multigraph, with keys being 
+    cluster labels, and values are lists of all neighbouring cluster labels, each repeated as many times as there are edges to it"""
+    C = sp.sparse.csr_matrix(cluster_graph)
+    return {i: np.repeat(C.indices[C.indptr[i]:C.indptr[i + 1]], C.data[C.indptr[i]:C.indptr[i + 1]].astype(int)).tolist()
+            for i in range(C.shape[0])}
 
-    return new_G
 
+def cluster_means(points, labels, num_clusters, chunk_size=10**6):
+    """Returns the mean of the points of each cluster, with zeros for empty clusters, and the number of points in each, in one pass over
+    the points chunk_size rows at a time"""
+    n, dim = points.shape
+    labels = np.asarray(labels)
+    counts = np.bincount(labels, minlength=num_clusters)
+    sums = np.zeros((num_clusters, dim))
+    for start in range(0, n, chunk_size):
+        chunk, chunk_labels = points[start:start + chunk_size], labels[start:start + chunk_size]
+        for d in range(dim):
+            sums[:, d] += np.bincount(chunk_labels, weights=chunk[:, d], minlength=num_clusters)
+    return sums / np.maximum(counts, 1)[:, None], counts
 
-def find_clusters(projected_graph, G, category_dict, num_clusters):
+
+def assign_clusters(points, means, chunk_size=10**5):
+    """Returns the label of the nearest of means, e.g. the cluster means of an earlier clustering, for each of points"""
+    means = np.asarray(means, dtype=np.float64)
+    norms = (means ** 2).sum(axis=1)
+    return np.concatenate([np.argmin(norms - 2 * np.asarray(points[start:start + chunk_size]) @ means.T, axis=1)
+                           for start in range(0, len(points), chunk_size)] or [np.zeros(0, dtype=np.int64)])
+
+
+@stage(items=lambda medoids, points, *args, **kwargs: len(points))
+def cluster_medoids(points, labels, num_clusters, chunk_size=10**6):
+    """Finds, for every cluster, the point closest to the mean of the cluster, in two vectorized passes over the points
+    
+    Parameters
+    ---------------------
+    points : Array
+            An n x dim array of points, e.g. the output of project_graph; it may be memory-mapped, as it is only read chunk_size rows at a time
+    labels : Array
+            The cluster label of each point, in range(num_clusters)
+    num_clusters : int
+            The number of clusters
+    chunk_size : int
+            The number of rows processed at once, which bounds the temporary memory used
+
+    Returns
+    ---------------------
+    medoids : Array
+        The index of the point closest to the mean of each cluster, or -1 for empty clusters; ties go to the lowest index
+    """
+    n = len(points)
+    labels = np.asarray(labels)
+    means, counts = cluster_means(points, labels, num_clusters, chunk_size)
+
+    distances = np.empty(n)
+    for start in range(0, n, chunk_size):
+        chunk, chunk_labels = points[start:start + chunk_size], labels[start:start + chunk_size]
+        distances[start:start + chunk_size] = ((chunk - means[chunk_labels]) ** 2).sum(axis=1)
+
+    # Sorting by label, then distance, puts each cluster's closest point first in its run of labels
+    order = np.lexsort((distances, labels))
+    first = np.searchsorted(labels[order], np.arange(num_clusters))
+    medoids = np.full(num_clusters, -1)
+    medoids[counts > 0] = order[first[counts > 0]]
+    return medoids
+
+
+@stage(items=lambda result, points, *args, **kwargs: len(points))
+def streaming_kmeans(points, num_clusters, batch_size=4096, epochs=3, chunk_size=10**6, seed=None):
+    """Clusters the points with MiniBatchKMeans, reading them chunk_size rows at a time, so that the embedding of a multi-million node graph
+    can be clustered from a memory-mapped array within bounded memory
+    
+    The batch size is raised to at least 3 * num_clusters, so that the first batch can seed every center. Returns the fitted MiniBatchKMeans 
+    model and the label of each point
+    """
+    n = len(points)
+    batch_size = max(batch_size, 3 * num_clusters)
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters, batch_size=batch_size, random_state=seed, n_init=1)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        for start in rng.permutation(np.arange(0, n, chunk_size)):
+            chunk = np.asarray(points[start:start + chunk_size])
+            chunk = chunk[rng.permutation(len(chunk))]
+            for batch in range(0, len(chunk), batch_size):
+                kmeans.partial_fit(chunk[batch:batch + batch_size])
+    labels = np.concatenate([kmeans.predict(np.asarray(points[start:start + chunk_size])) for start in range(0, n, chunk_size)])
+    return kmeans, labels
+
+
+@stage(items=lambda result, *args, **kwargs: len(result[0]))
+def find_clusters(projected_graph, G, category_dict, num_clusters, method='kmeans', batch_size=4096, seed=None):
     """A function to take a given graph, the projection of it into a lower dimensional space via a spectral projection, and a dictionary of 
     categories for each node in the graph, to perform kmeans clustering on the spectral projection, and return the cluster labels for each node
     and the central node for each cluster
@@ -180,32 +644,44 @@ def find_clusters(projected_graph, G, category_dict, num_clusters):
     projected_graph: Array
             Like the output of project_graph; this is a truncation of the lowest-modulus eigenvectors which function as a low-dimensional
             representation of the nodes in the graph. KMeans clustering is performed on these points to create clusters
-    G : NetworkX graph object
+    G : NetworkX graph object or GraphStore.CSRGraph
             The graph of which projected_graph is the projection; useful for finding cluster_centers
     category_dict : Dict
             Used to return a dictionary keyed by clusters, and whose values are the cluster center, and the categories corresponding 
             to the cluster center
+    num_clusters : int
+            The number of clusters
+    method : str
+            'kmeans' for full-batch KMeans, or 'minibatch' for streaming MiniBatchKMeans, which keeps memory bounded on multi-million node 
+            graphs (projected_graph can then be a memory-mapped array)
+    batch_size : int
+            The batch size of 'minibatch'
+    seed : int or None
+            Seeds the clustering, so that it is reproducible
 
     Returns
     ------------------
     kmeans_labels : List
         The ordered list of labels assigning each node to the label of the cluster it lies in, as found by kmeans
         clustering
-    cluster_centers : List
-        A list of arrays, with each array being the coordinates of the most central node in each cluster
+    cluster_centers : Dict
+        A dictionary keyed by cluster labels, whose values are tuples (title, categories) of the node closest to the center of each 
+        cluster and its categories (None if it has none)
     """
-    kmeans = KMeans(n_clusters=num_clusters)
-    kmeans.fit(projected_graph)
+    if method == 'kmeans':
+        kmeans = KMeans(n_clusters=num_clusters, random_state=seed)
+        kmeans.fit(projected_graph)
+        labels = kmeans.labels_
+    elif method == 'minibatch':
+        kmeans, labels = streaming_kmeans(projected_graph, num_clusters, batch_size, seed=seed)
+    else:
+        raise ValueError("method must be 'kmeans' or 'minibatch', not %r" % method)
+
+    nodes = list(G.nodes)
     cluster_centers = dict()
-    for i in set(kmeans.labels_):
-        points = projected_graph[[j for j in range(len(kmeans.labels_)) if kmeans.labels_[j] == i]]
-        center = sum(points) / len(points)
-        closest = pairwise_distances_argmin_min(points, center.reshape(1,-1), axis=0)
-        idx = [j for j in range(len(kmeans.labels_)) if kmeans.labels_[j] == i][closest[0][0]]
-        center = list(G.nodes)[idx]
-        try:
-            cluster_centers[i] = (center, category_dict[center])
-        except KeyError:
-            cluster_centers[i] = (center, None)
-
-    return kmeans.labels_, cluster_centers
\ No newline at end of file
+    for i, idx in enumerate(cluster_medoids(projected_graph, labels, num_clusters)):
+        if idx >= 0:
+            center = nodes[idx]
+            cluster_centers[i] = (center, category_dict.get(center))
+
+    return labels, cluster_centers
@@ -1,8 +1,30 @@
 import requests
+import aiohttp
+import asyncio
+from collections import deque, namedtuple
+from urllib.parse import unquote, urljoin, urlsplit
 from bs4 import BeautifulSoup, Tag
 import re
 import networkx as nx
 import json 
+import os
+import time
+import argparse
+import zlib
+import queue
+import multiprocessing
+from PageStore import PageStore, revalidation_headers
+from Instrument import stage
+
+WIKI_URL = 'https://en.wikipedia.org/'
+
+PageInfo = namedtuple('PageInfo', ['title', 'categories', 'see_also', 'see_also_notes'])
+
+# What the instrumented crawl stages count: pages fetched and their size, and pages added to the category dict, which
+# gets an entry for every page visited
+_page_size = lambda page, *args, **kwargs: len(page[0]) if page else 0
+_fetched = lambda page, *args, **kwargs: page is not None
+_visited = lambda url_or_frontier, dictionaries, *args, **kwargs: len(dictionaries[2])
 
 def find_sections(soup):
     """Finds sections in a BeautifulSoup object by searching for h2 headers
@@ -210,13 +232,357 @@ def get_titles_and_links(section):
                 pass
     return links
 
-def bfs_search(url, dictionaries, depth=3):
-    """Starting at a given url, searches outward to a depth of depth and adds the linkage data to a dictionary
+def _is_h2_heading(tag):
+    """Whether tag is an h2 header, or the div Wikipedia's newer skins wrap h2 headers in"""
+    if tag.name == 'h2':
+        return True
+    return tag.name == 'div' and 'mw-heading2' in tag.get('class', [])
+
+
+@stage('parse', items=lambda page, html: 1, size=lambda page, html: len(html))
+def extract_page(html):
+    """Extracts everything the crawl needs from the html of a Wikipedia page in a single lxml parse, replacing the 
+    chain of extract_title, get_cat_titles, find_sections, go_to_section, get_titles_and_links and find_see_also_notes
+    
+    Parameters
+    ---------------
+    html : str
+        The html of a Wikipedia page
+
+    Returns
+    ---------------
+    page : PageInfo
+        A namedtuple of the page's title, its list of categories, the list of (title, link) tuples in its "See also" 
+        section (None if it has no such section), and the list of (title, link) tuples in "See also" notes 
+        throughout the text of the article
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    title = ''
+    categories = []
+    see_also = None
+    see_also_notes = []
+
+    # One walk over the tree picks out the title, the category box, the "See also" notes and the first h2 whose 
+    # heading mentions "See also"
+    heading = None
+    for tag in soup.find_all(['title', 'h2', 'div']):
+        if tag.name == 'title':
+            if not title:
+                title = tag.text.split(' - ')[0]
+        elif tag.name == 'h2':
+            if heading is None and 'See also' in tag.text:
+                heading = tag
+        elif tag.get('id') == 'mw-normal-catlinks':
+            categories = [i.text for i in tag.find_all('a') if i.text != 'Categories']
+        elif tag.get('role') == 'note':
+            text = tag.text.strip()
+            if any(j in text for j in ['See also', 'see also', 'See Also']):
+                see_also_notes += [(j.text, j['href']) for j in tag.find_all('a') if j.has_attr('href')]
+
+    if heading is not None:
+        if _is_h2_heading(heading.parent):
+            heading = heading.parent
+        see_also = []
+        for sibling in heading.next_siblings:
+            if not isinstance(sibling, Tag):
+                continue
+            if _is_h2_heading(sibling):
+                break
+            see_also += [(j.text, j['href']) for j in sibling.find_all('a') if j.text != 'edit' and j.has_attr('href')]
+
+    return PageInfo(title, categories, see_also, see_also_notes)
+
+
+def add_page(page, page_url, dictionaries):
+    """Adds a single crawled page to the three crawl dictionaries, and returns the links found in its "See also" 
+    section and "See also" notes
+    
+    Parameters
+    ---------------
+    page : PageInfo
+        The output of extract_page for the page
+    page_url : str
+        The url the page was served from
+    dictionaries : List
+        A list of dictionaries, graph_dict, text_to_link_dict, category_dict respectively, as in bfs_search
+
+    Returns
+    ---------------
+    titles_and_links : List
+        A list of tuples of the form (title, link) for every page linked to from the "See also" section or a 
+        "See also" note of the page; empty if the page has no "See also" section
+    """
+    graph_dict, text_to_link_dict, category_dict = dictionaries
+    title = page.title
+    if title not in text_to_link_dict:
+        text_to_link_dict[title] = page_url
+    if title not in category_dict:
+        category_dict[title] = page.categories
+
+    if page.see_also is None:
+        return []
+
+    titles_and_links = page.see_also + page.see_also_notes
+
+    # Add to the dictionary
+    if title not in graph_dict:
+        graph_dict[title] = [i[0] for i in titles_and_links]
+        for (link_title, link) in titles_and_links:
+            text_to_link_dict[link_title] = link
+
+    return titles_and_links
+
+def normalize_link(link):
+    """Folds the different spellings of a link to a Wikipedia page onto a single key, so that e.g. 
+    '/wiki/Thirty_Years%27_War', 'wiki/Thirty Years' War' and 'https://en.wikipedia.org//wiki/Thirty_Years%27_War#Causes'
+    are all recognized as the same page
+    
+    Parameters
+    ---------------
+    link : str
+        An absolute or relative link to a Wikipedia page
+
+    Returns
+    ---------------
+    key : str
+        The page name the link points to, unquoted, with underscores for spaces and without any fragment
+    """
+    parts = urlsplit(link)
+    key = unquote(parts.path).lstrip('/')
+    if key.startswith('wiki/'):
+        key = key[len('wiki/'):]
+    if parts.query:
+        key += '?' + parts.query
+    return key.replace(' ', '_')
+
+
+class Frontier:
+    """The queue of pages still to be visited by a breadth-first search, along with the set of every page seen so 
+    far; both are keyed on normalize_link, so adding, checking and popping a link are all O(1)
+    
+    Parameters
+    ---------------
+    depth : int
+        The depth cutoff of the search; links further than depth from the start are never queued
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.queue = deque()
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, link, dist):
+        """Queues link at distance dist from the start, unless it is beyond the depth cutoff or has already been 
+        seen; returns whether it was queued"""
+        if dist > self.depth:
+            return False
+        key = normalize_link(link)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        self.queue.append((link, dist))
+        return True
+
+    def pop(self):
+        """Removes and returns the oldest (link, dist) pair in the queue"""
+        return self.queue.popleft()
+
+    def pop_level(self):
+        """Removes and returns every queued link at the same distance as the oldest one, along with that distance"""
+        dist = self.queue[0][1]
+        level = []
+        while self.queue and self.queue[0][1] == dist:
+            level.append(self.queue.popleft()[0])
+        return level, dist
+
+    def redirected(self, link, page_url):
+        """Records that link was served from page_url after redirects; returns False if page_url had already been 
+        seen under another link, in which case the page has been, or will be, visited through that link"""
+        key = normalize_link(page_url)
+        if key == normalize_link(link):
+            return True
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+    def state(self, unfinished=()):
+        """Returns a JSON-serializable snapshot of the frontier, for checkpointing a crawl
+        
+        Parameters
+        ---------------
+        unfinished : Iterable
+            (link, dist) pairs that have been popped but not yet added to the dictionaries; they are put back at 
+            the front of the queue, so that resuming from the snapshot visits them again
+        """
+        return {'depth': self.depth, 'queue': list(unfinished) + list(self.queue), 'seen': list(self.seen)}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuilds a Frontier from the output of Frontier.state"""
+        frontier = cls(state['depth'])
+        frontier.queue.extend((link, dist) for link, dist in state['queue'])
+        frontier.seen.update(state['seen'])
+        return frontier
+
+
+@stage('fetch', items=_fetched, size=_page_size)
+def get_page(session, url, store=None, offline=False):
+    """Fetches a single page through a requests session, going through the page store if one is given
     
     Parameters
     ---------------
+    session : requests.Session
+        The session whose connection pool is used for the request
     url : str
-        The url of a Wikipedia page
+        The absolute url of the page
+    store : PageStore or None
+        A store of previously crawled pages; a stored page is revalidated with a conditional request, and only 
+        downloaded again if it has changed
+    offline : bool
+        If True, never touch the network, and only return pages found in store
+
+    Returns
+    ---------------
+    (text, page_url) : Tuple
+        The html of the page and the url it was finally served from, or None if the page could not be fetched
+    """
+    key = normalize_link(url)
+    cached = store.get(key) if store is not None else None
+    if offline:
+        return (cached.html, cached.url) if cached else None
+
+    try:
+        response = session.get(url, headers=revalidation_headers(cached))
+    except requests.RequestException:
+        return None
+    if response.status_code == 304 and cached:
+        store.touch(key)
+        return cached.html, cached.url
+    if response.status_code != 200:
+        return None
+    if store is not None:
+        store.put(key, response.url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response.text, response.url
+
+
+class KnownPages:
+    """The pages of an earlier crawl, looked up by link, so that an incremental crawl only fetches the pages that are 
+    new or stale relative to it
+    
+    Parameters
+    ---------------
+    dictionaries : List
+        The graph_dict, text_to_link_dict and category_dict of the earlier crawl
+    store : PageStore or None
+        The page store of the earlier crawl; together with max_age, its fetch times decide which pages are stale
+    max_age : float or None
+        Pages last fetched more than max_age seconds ago are stale; None means known pages never go stale
+    """
+
+    def __init__(self, dictionaries, store=None, max_age=None):
+        self.graph_dict, self.text_to_link_dict, self.category_dict = dictionaries
+        self.store = store
+        self.max_age = max_age
+
+        # Every page that was fetched has an entry in category_dict, and its own link in text_to_link_dict
+        self.titles = dict()
+        for title in self.category_dict:
+            if title in self.text_to_link_dict:
+                self.titles[normalize_link(self.text_to_link_dict[title])] = title
+
+    def links(self, link):
+        """Returns the (title, link) pairs the earlier crawl found on the page at link, or None if the page is new or 
+        stale and so has to be fetched; a stale page is dropped from the dictionaries so its new version replaces it"""
+        key = normalize_link(link)
+        title = self.titles.get(key)
+        if title is None:
+            return None
+        if self.max_age is not None and self.store is not None:
+            fetched_at = self.store.fetched_at(key)
+            if fetched_at is None or fetched_at < time.time() - self.max_age:
+                self.graph_dict.pop(title, None)
+                self.category_dict.pop(title, None)
+                return None
+        return [(i, self.text_to_link_dict[i]) for i in self.graph_dict.get(title, []) if i in self.text_to_link_dict]
+
+
+def save_checkpoint(path, state, dictionaries, params):
+    """Atomically writes a crawl checkpoint to path, so that a crash mid-write never leaves a corrupt checkpoint
+    
+    Parameters
+    ---------------
+    path : str
+        The checkpoint file
+    state : Dict
+        The output of Frontier.state
+    dictionaries : List
+        The graph_dict, text_to_link_dict and category_dict of the crawl so far
+    params : Dict
+        The crawl settings resume_bfs_search needs to carry on where the crawl stopped
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'params': params, 'frontier': state, 'dictionaries': dictionaries}, f)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint, returning the Frontier, the dictionaries and the crawl settings"""
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return Frontier.from_state(checkpoint['frontier']), checkpoint['dictionaries'], checkpoint['params']
+
+
+def _start(url, depth):
+    """Makes the Frontier of a new crawl from one start link or a list of them"""
+    frontier = Frontier(depth)
+    for seed in ([url] if isinstance(url, str) else url):
+        frontier.add(seed, 0)
+    return frontier
+
+
+@stage('crawl', grows=_visited)
+def _crawl(frontier, dictionaries, base_url, store, offline, known, checkpoint, checkpoint_every, params):
+    """The loop of bfs_search, run until frontier is empty"""
+    session = requests.Session()
+    visited = 0
+
+    while frontier:
+            
+            curr_url, dist = frontier.pop()
+            titles_and_links = known.links(curr_url) if known is not None else None
+            if titles_and_links is None:
+                page = get_page(session, base_url + curr_url, store, offline)
+                if page is None:
+                    continue
+                text, page_url = page
+                if not frontier.redirected(curr_url, page_url):
+                    continue
+                titles_and_links = add_page(extract_page(text), page_url, dictionaries)
+
+            for (title, link) in titles_and_links:
+                frontier.add(link, dist + 1)
+
+            visited += 1
+            if checkpoint and visited % checkpoint_every == 0:
+                save_checkpoint(checkpoint, frontier.state(), dictionaries, params)
+
+    if checkpoint:
+        save_checkpoint(checkpoint, frontier.state(), dictionaries, params)
+
+
+def bfs_search(url, dictionaries, depth=3, base_url=WIKI_URL, store=None, offline=False, incremental=False, max_age=None,
+               checkpoint=None, checkpoint_every=1000):
+    """Starting at a given url, searches outward to a depth of depth and adds the linkage data to a dictionary
+    
+    Parameters
+    ---------------
+    url : str or List
+        The url of a Wikipedia page, or a list of them to search outward from all at once
     
     dictionaries : List
         A list of dictionaries, graph_dict, text_to_link_dict, category_dict respectively, which comprise:
@@ -235,6 +601,29 @@ def bfs_search(url, dictionaries, depth=3):
     Depth : int
         The depth to which the breadth-first search should go
 
+    base_url : str
+        The site the relative links are fetched from; point it at a local server of saved pages for testing
+
+    store : PageStore or None
+        A persistent store of crawled pages; pages already in it are only revalidated rather than downloaded again
+
+    offline : bool
+        If True, rebuild the dictionaries from the pages in store alone, without touching the network
+
+    incremental : bool
+        If True, the dictionaries hold an earlier crawl, and only pages that are new or stale relative to it are 
+        fetched; the rest are walked through using the links already recorded for them
+
+    max_age : float or None
+        With incremental, pages last fetched more than max_age seconds ago (according to store) are fetched again
+
+    checkpoint : str or None
+        A file to which the frontier and dictionaries are saved every checkpoint_every pages and at the end of the 
+        crawl; resume_bfs_search picks an interrupted crawl up from it
+
+    checkpoint_every : int
+        The number of pages visited between checkpoints
+
     Returns
     ----------------
     None
@@ -242,35 +631,454 @@ def bfs_search(url, dictionaries, depth=3):
         dictionaries in the appropriate way
     """
     
-    # Initialize the search by saying we have visited the start page, and the start page has a depth of 0
-    visited = [url]
-    queue = [(url, 0)]
+    frontier = _start(url, depth)
+    known = KnownPages(dictionaries, store, max_age) if incremental else None
+    params = {'mode': 'sync', 'base_url': base_url, 'store': store.path if store is not None else None, 
+              'offline': offline, 'incremental': incremental, 'max_age': max_age}
+    _crawl(frontier, dictionaries, base_url, store, offline, known, checkpoint, checkpoint_every, params)
+
+
+class HostRateLimiter:
+    """Spaces out the requests made to each host so that no host is sent more than rate requests per second
     
-    # Unpack the list of dictionaries into the three dictionaries we want
-    graph_dict, text_to_link_dict, category_dict = dictionaries 
+    Parameters
+    ---------------
+    rate : float or None
+        The maximum number of requests per second to send to any one host; None means no limit
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = dict()
+
+    async def wait(self, url):
+        """Sleeps until the host of url is allowed another request, and books the following slot"""
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+@stage('fetch', items=_fetched, size=_page_size)
+async def fetch_page(session, url, limiter, store=None, offline=False):
+    """Fetches a single page through a pooled aiohttp session, respecting the per-host rate limit; the asyncio 
+    counterpart of get_page
+    
+    Parameters
+    ---------------
+    session : aiohttp.ClientSession
+        The shared session whose connection pool is used for the request
+    url : str
+        The absolute url of the page
+    limiter : HostRateLimiter
+        The rate limiter shared by every request of the crawl
+    store : PageStore or None
+        A store of previously crawled pages, used as in get_page
+    offline : bool
+        If True, never touch the network, and only return pages found in store
+
+    Returns
+    ---------------
+    (text, page_url) : Tuple
+        The html of the page and the url it was finally served from, or None if the page could not be fetched
+    """
+    key = normalize_link(url)
+    cached = store.get(key) if store is not None else None
+    if offline:
+        return (cached.html, cached.url) if cached else None
+
+    await limiter.wait(url)
+    try:
+        async with session.get(url, headers=revalidation_headers(cached)) as response:
+            if response.status == 304 and cached:
+                store.touch(key)
+                return cached.html, cached.url
+            if response.status != 200:
+                return None
+            text, page_url = await response.text(), str(response.url)
+            if store is not None:
+                store.put(key, page_url, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return text, page_url
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+
+@stage('crawl', grows=_visited)
+async def _async_crawl(frontier, dictionaries, concurrency, rate_limit, base_url, store, offline, known, checkpoint,
+                       checkpoint_every, params):
+    """The loop of async_bfs_search, run until frontier is empty"""
+    limiter = HostRateLimiter(rate_limit)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    visited = 0
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        while frontier:
+            level, dist = frontier.pop_level()
+            pending = deque(level)
+            in_flight = set()
+
+            async def worker():
+                nonlocal visited
+                # The workers share the level, so each page is fetched by exactly one of them
+                while pending:
+                    curr_url = pending.popleft()
+                    titles_and_links = known.links(curr_url) if known is not None else None
+                    if titles_and_links is None:
+                        in_flight.add(curr_url)
+                        page = await fetch_page(session, urljoin(base_url, curr_url), limiter, store, offline)
+                        in_flight.discard(curr_url)
+                        if page is None:
+                            continue
+                        text, page_url = page
+                        if not frontier.redirected(curr_url, page_url):
+                            continue
+                        titles_and_links = add_page(extract_page(text), page_url, dictionaries)
 
-    while queue and not all(q[1] > depth for q in queue):
-            
-            curr_url, dist = queue.pop(-1) 
-            response = requests.get('https://en.wikipedia.org/' + curr_url)
-            soup = BeautifulSoup(response.text)
-            add_to_link_dict(response, text_to_link_dict)
-            add_to_cat_dict(soup, category_dict)
-
-            if any('See also' in i for i in find_sections(soup)):
-                j = ['See also' in i for i in find_sections(soup)].index(True)
-                titles_and_links = get_titles_and_links(go_to_section(soup, find_sections(soup)[j]))
-                also_titles_and_links = find_see_also_notes(soup)
-
-                # Add to the dictionary
-                if extract_title(soup) not in graph_dict:
-                    graph_dict[extract_title(soup)] = [i[0] for i in titles_and_links] + [i[0] for i in also_titles_and_links]
                     for (title, link) in titles_and_links:
-                        text_to_link_dict[title] = link
-                    for (title, link) in also_titles_and_links:
-                        text_to_link_dict[title] = link
-
-                for (title, link) in titles_and_links + also_titles_and_links:
-                    if link not in visited:
-                        visited.append(link)
-                        queue.insert(0, (link, dist + 1))
\ No newline at end of file
+                        frontier.add(link, dist + 1)
+
+                    visited += 1
+                    if checkpoint and visited % checkpoint_every == 0:
+                        # Pages other workers are still fetching go back in the queue along with the rest of the level
+                        unfinished = [(link, dist) for link in list(in_flight) + list(pending)]
+                        save_checkpoint(checkpoint, frontier.state(unfinished), dictionaries, params)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    if checkpoint:
+        save_checkpoint(checkpoint, frontier.state(), dictionaries, params)
+
+
+async def async_bfs_search(url, dictionaries, depth=3, concurrency=16, rate_limit=None, base_url=WIKI_URL,
+                           store=None, offline=False, incremental=False, max_age=None, checkpoint=None,
+                           checkpoint_every=1000):
+    """The asyncio version of bfs_search: fetches up to concurrency pages at once over a pooled HTTP client
+    
+    The search proceeds one depth level at a time, so every page within depth of url is visited exactly as in
+    bfs_search, although pages within a level are added to the dictionaries in the order their responses arrive.
+
+    Parameters
+    ---------------
+    url : str or List
+        The url of a Wikipedia page, relative to base_url, or a list of them
+    dictionaries : List
+        A list of dictionaries, graph_dict, text_to_link_dict, category_dict respectively, as in bfs_search
+    depth : int
+        The depth to which the breadth-first search should go
+    concurrency : int
+        The maximum number of requests in flight at once; also the size of the connection pool
+    rate_limit : float or None
+        The maximum number of requests per second sent to any one host
+    base_url : str
+        The site the relative links are fetched from; point it at a local server of saved pages for testing
+    store : PageStore or None
+        A persistent store of crawled pages; pages already in it are only revalidated rather than downloaded again
+    offline : bool
+        If True, rebuild the dictionaries from the pages in store alone, without touching the network
+    incremental : bool
+        If True, only fetch the pages that are new or stale relative to the crawl already in dictionaries
+    max_age : float or None
+        With incremental, pages last fetched more than max_age seconds ago (according to store) are fetched again
+    checkpoint : str or None
+        A file to which the crawl is saved every checkpoint_every pages and at the end, for resume_bfs_search
+    checkpoint_every : int
+        The number of pages visited between checkpoints
+
+    Returns
+    ----------------
+    None
+        Modifies the dictionaries in-place, as bfs_search does
+    """
+    frontier = _start(url, depth)
+    known = KnownPages(dictionaries, store, max_age) if incremental else None
+    params = {'mode': 'async', 'base_url': base_url, 'store': store.path if store is not None else None, 
+              'offline': offline, 'incremental': incremental, 'max_age': max_age, 'concurrency': concurrency, 
+              'rate_limit': rate_limit}
+    await _async_crawl(frontier, dictionaries, concurrency, rate_limit, base_url, store, offline, known, checkpoint,
+                       checkpoint_every, params)
+
+
+def concurrent_bfs_search(url, dictionaries, depth=3, concurrency=16, rate_limit=None, base_url=WIKI_URL,
+                          store=None, offline=False, incremental=False, max_age=None, checkpoint=None,
+                          checkpoint_every=1000):
+    """Runs async_bfs_search to completion from synchronous code; takes the same parameters as async_bfs_search"""
+    asyncio.run(async_bfs_search(url, dictionaries, depth, concurrency, rate_limit, base_url, store, offline,
+                                 incremental, max_age, checkpoint, checkpoint_every))
+
+
+def resume_bfs_search(checkpoint, checkpoint_every=1000):
+    """Carries on a crawl from its last checkpoint, with the settings it was started with
+    
+    Parameters
+    ---------------
+    checkpoint : str
+        The checkpoint file given to bfs_search, async_bfs_search or sharded_bfs_search; it keeps being updated 
+        as the crawl goes on
+    checkpoint_every : int
+        The number of pages visited between checkpoints
+
+    Returns
+    ---------------
+    dictionaries : List
+        The graph_dict, text_to_link_dict and category_dict of the finished crawl
+    """
+    frontier, dictionaries, params = load_checkpoint(checkpoint)
+    store = PageStore(params['store']) if params['store'] else None
+    known = KnownPages(dictionaries, store, params['max_age']) if params['incremental'] else None
+    if params['mode'] == 'async':
+        asyncio.run(_async_crawl(frontier, dictionaries, params['concurrency'], params['rate_limit'], 
+                                 params['base_url'], store, params['offline'], known, checkpoint, checkpoint_every, 
+                                 params))
+    elif params['mode'] == 'sharded':
+        _sharded_crawl(frontier, dictionaries, params['processes'], params['concurrency'], params['rate_limit'],
+                       params['base_url'], store, params['offline'], known, checkpoint, checkpoint_every, params,
+                       params['batch_size'])
+    else:
+        _crawl(frontier, dictionaries, params['base_url'], store, params['offline'], known, checkpoint, 
+               checkpoint_every, params)
+    return dictionaries
+
+
+def shard_of(link, shards):
+    """The worker process a link belongs to; the hash is stable across processes and runs, unlike hash()"""
+    return zlib.crc32(normalize_link(link).encode('utf-8')) % shards
+
+
+async def _fetch_batch(session, links, limiter, concurrency, base_url, store, offline):
+    """Fetches and extracts a batch of pages, returning a (link, page_url, PageInfo) record for each page that loaded"""
+    records = []
+    pending = deque(links)
+
+    async def worker():
+        while pending:
+            link = pending.popleft()
+            page = await fetch_page(session, urljoin(base_url, link), limiter, store, offline)
+            if page is not None:
+                text, page_url = page
+                records.append((link, page_url, extract_page(text)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records
+
+
+def _shard_worker(inbox, outbox, base_url, store_path, offline, concurrency, rate_limit):
+    """The loop of a sharded_bfs_search worker process: takes batches of links from inbox until it gets None, and 
+    sends back each batch with its records through outbox"""
+    store = PageStore(store_path) if store_path else None
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        limiter = HostRateLimiter(rate_limit)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while True:
+                links = await loop.run_in_executor(None, inbox.get)
+                if links is None:
+                    break
+                outbox.put((links, await _fetch_batch(session, links, limiter, concurrency, base_url, store, offline)))
+
+    asyncio.run(serve())
+
+
+@stage('crawl', grows=_visited)
+def _sharded_crawl(frontier, dictionaries, processes, concurrency, rate_limit, base_url, store, offline, known,
+                   checkpoint, checkpoint_every, params, batch_size):
+    """The loop of sharded_bfs_search, run until frontier is empty"""
+    worker_rate = rate_limit / processes if rate_limit else None
+    store_path = store.path if store is not None else None
+    visited = 0
+
+    outbox = multiprocessing.Queue()
+    inboxes = [multiprocessing.Queue() for _ in range(processes)]
+    workers = [multiprocessing.Process(target=_shard_worker, daemon=True,
+                                       args=(inbox, outbox, base_url, store_path, offline, concurrency, worker_rate))
+               for inbox in inboxes]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while frontier:
+            level, dist = frontier.pop_level()
+            shards = [[] for _ in range(processes)]
+            for link in level:
+                titles_and_links = known.links(link) if known is not None else None
+                if titles_and_links is None:
+                    shards[shard_of(link, processes)].append(link)
+                    continue
+                for (title, next_link) in titles_and_links:
+                    frontier.add(next_link, dist + 1)
+                visited += 1
+
+            # The links sent out whose batches have not come back yet, which a checkpoint puts back in the queue
+            unfinished = dict()
+            for inbox, shard in zip(inboxes, shards):
+                for i in range(0, len(shard), batch_size):
+                    inbox.put(shard[i:i + batch_size])
+                    unfinished.update(dict.fromkeys(shard[i:i + batch_size]))
+
+            while unfinished:
+                try:
+                    links, records = outbox.get(timeout=1)
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in workers):
+                        raise RuntimeError('A crawl worker process died')
+                    continue
+                for link, page_url, page in records:
+                    del unfinished[link]
+                    if not frontier.redirected(link, page_url):
+                        continue
+                    for (title, next_link) in add_page(page, page_url, dictionaries):
+                        frontier.add(next_link, dist + 1)
+                    visited += 1
+                    if checkpoint and visited % checkpoint_every == 0:
+                        save_checkpoint(checkpoint, frontier.state([(link, dist) for link in unfinished]),
+                                        dictionaries, params)
+                # The links of the batch that failed to load
+                for link in links:
+                    unfinished.pop(link, None)
+    finally:
+        for inbox in inboxes:
+            inbox.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+    if checkpoint:
+        save_checkpoint(checkpoint, frontier.state(), dictionaries, params)
+
+
+def sharded_bfs_search(url, dictionaries, depth=3, processes=None, concurrency=16, rate_limit=None, base_url=WIKI_URL,
+                       store=None, offline=False, incremental=False, max_age=None, checkpoint=None,
+                       checkpoint_every=1000, batch_size=100):
+    """The multi-process version of bfs_search: the frontier is split across a pool of worker processes by hashing 
+    each link, and the workers fetch and parse their pages while this process merges their records
+    
+    Each worker keeps its own connection pool and page store connection, and parses its pages with extract_page, so 
+    the CPU-bound parsing runs on every core. The workers send back the PageInfo of each page, which are added to the 
+    dictionaries with add_page exactly as in bfs_search. As in async_bfs_search, the search goes one depth level at a 
+    time, and pages within a level are added in the order their records arrive.
+
+    Parameters
+    ---------------
+    url : str or List
+        The url of a Wikipedia page, relative to base_url, or a list of them
+    dictionaries : List
+        A list of dictionaries, graph_dict, text_to_link_dict, category_dict respectively, as in bfs_search
+    depth : int
+        The depth to which the breadth-first search should go
+    processes : int or None
+        The number of worker processes; defaults to the number of cores
+    concurrency : int
+        The maximum number of requests in flight at once in each worker
+    rate_limit : float or None
+        The maximum number of requests per second sent to any one host, across all workers
+    base_url : str
+        The site the relative links are fetched from; point it at a local server of saved pages for testing
+    store : PageStore or None
+        A persistent store of crawled pages, which every worker opens separately
+    offline : bool
+        If True, rebuild the dictionaries from the pages in store alone, without touching the network
+    incremental : bool
+        If True, only fetch the pages that are new or stale relative to the crawl already in dictionaries
+    max_age : float or None
+        With incremental, pages last fetched more than max_age seconds ago (according to store) are fetched again
+    checkpoint : str or None
+        A file to which the crawl is saved every checkpoint_every pages and at the end, for resume_bfs_search
+    checkpoint_every : int
+        The number of pages visited between checkpoints
+    batch_size : int
+        The number of links sent to a worker at once
+
+    Returns
+    ----------------
+    None
+        Modifies the dictionaries in-place, as bfs_search does
+    """
+    processes = processes or os.cpu_count()
+    frontier = _start(url, depth)
+    known = KnownPages(dictionaries, store, max_age) if incremental else None
+    params = {'mode': 'sharded', 'base_url': base_url, 'store': store.path if store is not None else None,
+              'offline': offline, 'incremental': incremental, 'max_age': max_age, 'processes': processes,
+              'concurrency': concurrency, 'rate_limit': rate_limit, 'batch_size': batch_size}
+    _sharded_crawl(frontier, dictionaries, processes, concurrency, rate_limit, base_url, store, offline, known,
+                   checkpoint, checkpoint_every, params, batch_size)
+
+
+OUTPUT_FILES = ['graph.json', 'titlelink.json', 'cats.json']
+
+
+def load_dictionaries(directory):
+    """Reads graph_dict, text_to_link_dict and category_dict from the json files of an earlier crawl in directory, 
+    or returns empty dictionaries if there are none"""
+    dictionaries = []
+    for name in OUTPUT_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path) as json_file:
+                dictionaries.append(json.load(json_file))
+        else:
+            dictionaries.append(dict())
+    return dictionaries
+
+
+def save_dictionaries(directory, dictionaries):
+    """Writes graph_dict, text_to_link_dict and category_dict to graph.json, titlelink.json and cats.json in directory"""
+    os.makedirs(directory, exist_ok=True)
+    for name, dictionary in zip(OUTPUT_FILES, dictionaries):
+        with open(os.path.join(directory, name), 'w') as json_file:
+            json.dump(dictionary, json_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl the "See also" graph of Wikipedia')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl = commands.add_parser('crawl', help='crawl outward from one or more start pages')
+    crawl.add_argument('seeds', nargs='+', help='links of the start pages, e.g. wiki/Gupta_Empire')
+    crawl.add_argument('--depth', type=int, default=3)
+    crawl.add_argument('--out', default='.', help='directory for graph.json, titlelink.json and cats.json')
+    crawl.add_argument('--store', help='SQLite page store to cache and revalidate pages in')
+    crawl.add_argument('--offline', action='store_true', help='only use pages already in --store')
+    crawl.add_argument('--concurrency', type=int, default=0, help='crawl asynchronously with this many requests at once')
+    crawl.add_argument('--rate-limit', type=float, help='maximum requests per second per host')
+    crawl.add_argument('--processes', type=int, default=0, help='split the crawl across this many worker processes')
+    crawl.add_argument('--incremental', action='store_true', 
+                       help='extend the crawl already in --out, only fetching new or stale pages')
+    crawl.add_argument('--max-age', type=float, help='with --incremental, refetch pages older than this many days')
+    crawl.add_argument('--checkpoint', help='file to checkpoint the crawl to')
+    crawl.add_argument('--checkpoint-every', type=int, default=1000)
+    crawl.add_argument('--base-url', default=WIKI_URL)
+
+    resume = commands.add_parser('resume', help='carry on an interrupted crawl from its checkpoint')
+    resume.add_argument('checkpoint')
+    resume.add_argument('--out', default='.', help='directory for graph.json, titlelink.json and cats.json')
+    resume.add_argument('--checkpoint-every', type=int, default=1000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'resume':
+        save_dictionaries(args.out, resume_bfs_search(args.checkpoint, args.checkpoint_every))
+        return
+
+    dictionaries = load_dictionaries(args.out) if args.incremental else [dict(), dict(), dict()]
+    store = PageStore(args.store) if args.store else None
+    max_age = args.max_age * 24 * 60 * 60 if args.max_age is not None else None
+    if args.processes:
+        sharded_bfs_search(args.seeds, dictionaries, args.depth, args.processes, args.concurrency or 16, 
+                           args.rate_limit, args.base_url, store, args.offline, args.incremental, max_age,
+                           args.checkpoint, args.checkpoint_every)
+    elif args.concurrency:
+        concurrent_bfs_search(args.seeds, dictionaries, args.depth, args.concurrency, args.rate_limit, args.base_url, 
+                              store, args.offline, args.incremental, max_age, args.checkpoint, args.checkpoint_every)
+    else:
+        bfs_search(args.seeds, dictionaries, args.depth, args.base_url, store, args.offline, args.incremental, 
+                   max_age, args.checkpoint, args.checkpoint_every)
+    save_dictionaries(args.out, dictionaries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Load test of the Flask app: latency percentiles and throughput of the home and results pages.
+
+By default the app in App/ is served in-process by a threaded werkzeug server on a free local port; pass --app to
+serve another checkout of it (e.g. an older one, to compare before and after a change), or --url to load test a
+server that is already running, such as gunicorn. Each client thread keeps one HTTP connection open and sends
+requests back to back; half of them ask for the results of a random subject of answer_dict.json.
+
+Usage: python benchmarks/bench_app.py [--app APP_DIR | --url URL] [--requests N] [--concurrency C]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, quote_plus
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App')
+
+
+def serve_app(app_dir):
+    """Starts the app in app_dir on a free local port in a background thread, and returns its url"""
+    from werkzeug.serving import make_server
+
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:%d' % server.server_port
+
+
+def client(url, paths, latencies, errors):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def load_test(url, subjects, num_requests, concurrency, seed=0):
+    rng = random.Random(seed)
+    paths = ['/' if rng.random() < 0.5 else '/?subject=' + quote_plus(rng.choice(subjects))
+             for _ in range(num_requests)]
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, paths[i::concurrency], latencies, errors))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'requests': num_requests, 'errors': len(errors), 'seconds': elapsed,
+            'requests_per_second': num_requests / elapsed,
+            'p50_ms': 1000 * latencies[len(latencies) // 2],
+            'p99_ms': 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--app', default=APP_DIR, help='the App directory to serve in-process')
+    parser.add_argument('--url', help='load test an already running server instead')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=50)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.app, 'answer_dict.json')) as f:
+        subjects = list(json.load(f))
+    url = args.url or serve_app(os.path.abspath(args.app))
+    load_test(url, subjects, args.warmup, 1)
+    result = load_test(url, subjects, args.requests, args.concurrency)
+    print('%(requests)d requests, %(errors)d errors in %(seconds).2f s' % result)
+    print('p50 %(p50_ms)8.2f ms   p99 %(p99_ms)8.2f ms   %(requests_per_second)8.1f requests/s' % result)
@@ -0,0 +1,75 @@
+"""Timings of find_clusters on synthetic spectral embeddings: the clustering itself (full-batch KMeans and streaming MiniBatchKMeans) and
+the cluster-center step, vectorized in cluster_medoids versus the per-cluster Python loops find_clusters used to run.
+
+The embeddings are dim-dimensional Gaussian blobs around num_clusters random centers, written to a memory-mapped .npy file so that the
+streaming path reads them the way it would read the embedding of a multi-million node graph.
+
+Usage: python benchmarks/bench_clusters.py [sizes...] [--clusters K] [--dim D] [--kmeans-limit N] [--loop-limit N]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import pairwise_distances_argmin_min
+from ProjectAlgorithm import cluster_medoids, streaming_kmeans
+
+
+def make_embedding(path, n, dim, num_clusters, seed=0, chunk_size=10**6):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim))
+    points = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n, dim))
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        points[start:start + size] = centers[rng.integers(0, num_clusters, size)] + 0.3 * rng.standard_normal((size, dim))
+    points.flush()
+    return np.load(path, mmap_mode='r')
+
+
+def loop_centers(points, labels, nodes):
+    """The cluster-center step as find_clusters used to do it"""
+    centers = dict()
+    for i in set(labels):
+        cluster = points[[j for j in range(len(labels)) if labels[j] == i]]
+        center = sum(cluster) / len(cluster)
+        closest = pairwise_distances_argmin_min(cluster, center.reshape(1, -1), axis=0)
+        idx = [j for j in range(len(labels)) if labels[j] == i][closest[0][0]]
+        centers[i] = list(nodes)[idx]
+    return centers
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[10**5, 10**6, 5 * 10**6])
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--dim', type=int, default=10)
+    parser.add_argument('--kmeans-limit', type=int, default=10**6, help='largest size to run full-batch KMeans on')
+    parser.add_argument('--loop-limit', type=int, default=10**5, help='largest size to run the old center loop on')
+    args = parser.parse_args()
+
+    print('%10s %14s %14s %14s %14s %12s' % ('nodes', 'KMeans s', 'MiniBatch s', 'medoids s', 'old loop s', 'max RSS MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        for n in args.sizes:
+            points = make_embedding(os.path.join(directory, 'embedding_%d.npy' % n), n, args.dim, args.clusters)
+
+            kmeans_time = old_time = float('nan')
+            if n <= args.kmeans_limit:
+                kmeans, kmeans_time = timed(KMeans(n_clusters=args.clusters, n_init=1, random_state=0).fit, np.asarray(points))
+            (model, labels), minibatch_time = timed(streaming_kmeans, points, args.clusters, seed=0)
+            medoids, medoid_time = timed(cluster_medoids, points, labels, args.clusters)
+            if n <= args.loop_limit:
+                _, old_time = timed(loop_centers, np.asarray(points), labels, ['node %d' % i for i in range(n)])
+
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print('%10d %14.2f %14.2f %14.3f %14.2f %12.0f' % (n, kmeans_time, minibatch_time, medoid_time, old_time, rss))
@@ -0,0 +1,68 @@
+"""Microbenchmark of page extraction: extract_page against the helper chain bfs_search used to run on every page.
+
+The corpus is either a directory of saved Wikipedia pages (one html file per page, searched recursively), e.g. a 
+local mirror made for testing the crawler, or a PageStore file filled by an earlier crawl. Pages without a "See also" 
+section are timed too, as they are in a crawl.
+
+Usage: python benchmarks/bench_extract.py CORPUS_DIR_OR_PAGE_STORE [repeats]
+"""
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from bs4 import BeautifulSoup
+from PageStore import PageStore
+from WikiScraper import (add_to_cat_dict, add_to_link_dict, extract_page, extract_title, find_sections,
+                         find_see_also_notes, get_titles_and_links, go_to_section)
+
+Response = namedtuple('Response', ['text', 'url'])
+
+
+def helper_chain(html):
+    """What bfs_search did for every page before extract_page: three parses and repeated section and title lookups"""
+    response = Response(html, '')
+    soup = BeautifulSoup(response.text, 'lxml')
+    add_to_link_dict(response, {})
+    add_to_cat_dict(soup, {})
+    if any('See also' in i for i in find_sections(soup)):
+        j = ['See also' in i for i in find_sections(soup)].index(True)
+        titles_and_links = get_titles_and_links(go_to_section(soup, find_sections(soup)[j]))
+        also_titles_and_links = find_see_also_notes(soup)
+        extract_title(soup)
+        extract_title(soup)
+        return titles_and_links + also_titles_and_links
+
+
+def load_corpus(directory):
+    if os.path.isfile(directory):
+        with PageStore(directory) as store:
+            return [page.html for key, page in store.items()]
+    pages = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    return pages
+
+
+def bench(function, pages, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for html in pages:
+            function(html)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+
+if __name__ == '__main__':
+    pages = load_corpus(sys.argv[1])
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print('%d pages, %.1f kB on average' % (len(pages), sum(map(len, pages)) / len(pages) / 1000))
+    old = bench(helper_chain, pages, repeats)
+    new = bench(extract_page, pages, repeats)
+    print('helper chain  %8.2f ms/page' % (old * 1000))
+    print('extract_page  %8.2f ms/page' % (new * 1000))
+    print('speedup       %8.1fx' % (old / new))
@@ -0,0 +1,68 @@
+"""Benchmark of the bfs_search frontier: the cost of handling one crawled page as the number of discovered links grows.
+
+Each simulated page pops one link off the frontier and offers it LINKS_PER_PAGE "See also" links, about half of 
+which have been seen before. The Frontier should stay flat all the way up to millions of links, while the list-based 
+queue and visited list bfs_search used to keep grow linearly per page (so quadratically over the crawl).
+
+Usage: python benchmarks/bench_frontier.py [max_links]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from WikiScraper import Frontier
+
+LINKS_PER_PAGE = 6
+PAGES_PER_SAMPLE = 2000
+LIST_LIMIT = 40000
+
+
+def make_links(n):
+    return ['/wiki/Page_%d' % i for i in range(n)]
+
+
+def bench_frontier(size, links):
+    """Time per page once size links have been seen and queued"""
+    frontier = Frontier(depth=10)
+    for link in links[:size]:
+        frontier.add(link, 1)
+    offered = [links[random.randrange(2 * size)] for _ in range(PAGES_PER_SAMPLE * LINKS_PER_PAGE)]
+
+    start = time.perf_counter()
+    for i in range(PAGES_PER_SAMPLE):
+        curr_url, dist = frontier.pop()
+        for link in offered[i * LINKS_PER_PAGE:(i + 1) * LINKS_PER_PAGE]:
+            frontier.add(link, dist + 1)
+    return (time.perf_counter() - start) / PAGES_PER_SAMPLE
+
+
+def bench_list(size, links):
+    """The same measurement for the list-based queue and visited list bfs_search used before the Frontier"""
+    visited = links[:size]
+    queue = [(link, 1) for link in links[:size]]
+    offered = [links[random.randrange(2 * size)] for _ in range(PAGES_PER_SAMPLE * LINKS_PER_PAGE)]
+
+    start = time.perf_counter()
+    for i in range(PAGES_PER_SAMPLE):
+        all(q[1] > 10 for q in queue)
+        curr_url, dist = queue.pop(-1)
+        for link in offered[i * LINKS_PER_PAGE:(i + 1) * LINKS_PER_PAGE]:
+            if link not in visited:
+                visited.append(link)
+                queue.insert(0, (link, dist + 1))
+    return (time.perf_counter() - start) / PAGES_PER_SAMPLE
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    max_links = int(sys.argv[1]) if len(sys.argv) > 1 else 3 * 10**6
+    links = make_links(2 * max_links)
+    size = 10000
+    print('%12s %18s %18s' % ('links', 'Frontier us/page', 'list us/page'))
+    while size <= max_links:
+        frontier_time = bench_frontier(size, links)
+        list_time = '%18.1f' % (bench_list(size, links) * 1e6) if size <= LIST_LIMIT else '%18s' % '-'
+        print('%12d %18.1f %s' % (size, frontier_time * 1e6, list_time))
+        size *= 4
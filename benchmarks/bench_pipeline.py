@@ -0,0 +1,296 @@
+"""Reproducible benchmark of the analysis pipeline on synthetic scale-free graphs, with results written to json so that
+runs on different commits can be compared.
+
+The graphs mimic graph.json: only a fraction of the nodes are crawled pages with a "See also" list, the rest are the
+pages those lists link to. Out-degrees follow a Pareto law and links point to nodes drawn with power-law weights, a
+directed Chung-Lu configuration model, so both degree distributions are heavy-tailed like the histograms of the
+README. The defaults are fitted to graph.json: 14% of its 78k nodes are crawled, with a median of 7 and a mean of 14
+links each, and the maximum likelihood exponent of its in-degrees is about 2. Every crawled page gets a few
+categories drawn from a Zipf-distributed table, and the cluster names are computed with random word vectors.
+
+For each size the ProjectAlgorithm functions are run in pipeline order, each on the output of the previous ones, and
+the scraper's parse helpers are run once on synthetic pages whose "See also" sections link to nodes of the smallest
+graph. Each function is timed, then run again under tracemalloc for its peak memory (numpy arrays included); a function
+that fails, e.g. runs out of memory, is recorded with its error and the functions depending on it are skipped. The
+results are rewritten after every size, so a run killed at 10M nodes still leaves those of the smaller sizes.
+
+Usage: python benchmarks/bench_pipeline.py [sizes...] [--out FILE] [--no-memory]
+       python benchmarks/bench_pipeline.py --compare OLD.json NEW.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+import scipy
+import sklearn
+import ProjectAlgorithm as pa
+import WikiScraper as ws
+from bs4 import BeautifulSoup, GuessedAtParserWarning
+from Embeddings import Embeddings
+from GraphStore import CSRGraph
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def scale_free_graph(n, crawled_fraction=0.14, min_out_degree=5, out_exponent=2.5, in_exponent=2.0, seed=0):
+    """A directed scale-free graph like graph.json, as a CSRGraph whose crawled pages come first
+
+    The out-degree of each crawled page is floor(min_out_degree * U^(-1 / (out_exponent - 1))) for U uniform, capped at
+    n - 1, and the targets of its links are drawn with weights (rank + 1)^(-1 / (in_exponent - 1)) over a random
+    ranking of the nodes, which gives in-degrees a power law of exponent in_exponent. Self-links are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    num_crawled = max(1, int(crawled_fraction * n))
+    out_degrees = np.minimum(np.floor(min_out_degree * rng.random(num_crawled) ** (-1 / (out_exponent - 1))), n - 1)
+    out_degrees = out_degrees.astype(np.int64)
+    weights = np.arange(1, n + 1, dtype=np.float64) ** (-1 / (in_exponent - 1))
+    cumulative = np.cumsum(weights[rng.permutation(n)])
+    sources = np.repeat(np.arange(num_crawled), out_degrees)
+    targets = np.searchsorted(cumulative, rng.random(len(sources)) * cumulative[-1]).astype(np.int64)
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:num_crawled + 1] = np.cumsum(np.bincount(sources, minlength=num_crawled))
+    indptr[num_crawled + 1:] = indptr[num_crawled]
+    titles = ['Page %d' % i for i in range(n)]
+    return CSRGraph(titles, indptr.astype(np.int32), targets.astype(np.int32), num_crawled)
+
+
+def category_table(num_categories, vocabulary_size=20000, seed=0):
+    """Category names of two to four words drawn from a Zipf-distributed vocabulary"""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    vocabulary = [''.join(rng.choice(letters, rng.integers(3, 10))) for _ in range(vocabulary_size)]
+    weights = 1 / np.arange(1, vocabulary_size + 1)
+    words = rng.choice(vocabulary_size, size=(num_categories, 4), p=weights / weights.sum())
+    lengths = rng.integers(2, 5, num_categories)
+    return vocabulary, [' '.join(vocabulary[w] for w in row[:k]) for row, k in zip(words, lengths)]
+
+
+def category_dict(graph, categories, mean_categories=7, seed=0):
+    """A dictionary like cats.json giving every crawled page of graph a few categories, drawn with Zipf weights"""
+    rng = np.random.default_rng(seed)
+    counts = 1 + rng.poisson(mean_categories - 1, graph.num_keys)
+    weights = 1 / np.arange(1, len(categories) + 1)
+    drawn = rng.choice(len(categories), size=counts.sum(), p=weights / weights.sum())
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return {graph.titles[i]: [categories[c] for c in drawn[bounds[i]:bounds[i + 1]]] for i in range(graph.num_keys)}
+
+
+def random_embeddings(words, dim=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return Embeddings(words, rng.standard_normal((len(words), dim)).astype(np.float32))
+
+
+def page_html(graph, i, categories):
+    """A Wikipedia-like page for node i of graph, whose "See also" section links to its neighbours"""
+    title = graph.titles[i]
+    links = ''.join('<li><a href="/wiki/%s" title="%s">%s</a></li>' % (graph.titles[j].replace(' ', '_'),
+                                                                       graph.titles[j], graph.titles[j])
+                    for j in graph.indices[graph.indptr[i]:graph.indptr[i + 1]])
+    paragraphs = ''.join('<p>Paragraph %d of <a href="/wiki/Other_%d">the article</a> about %s.</p>' % (k, k, title)
+                         for k in range(20))
+    note = '<div role="note" class="hatnote">See also: <a href="/wiki/Note_%d">Note %d</a></div>' % (i, i)
+    cats = ''.join('<li><a href="/wiki/Category:%s">%s</a></li>' % (c.replace(' ', '_'), c) for c in categories)
+    return ('<html><head><title>%s - Wikipedia</title></head><body><div id="content">'
+            '<h2>History</h2>%s%s<h2>See also</h2><ul>%s</ul><h2>References</h2>%s'
+            '<div id="catlinks"><div id="mw-normal-catlinks"><a href="/wiki/Help:Category">Categories</a>'
+            '<ul>%s</ul></div></div></div></body></html>' % (title, note, paragraphs, links, paragraphs, cats))
+
+
+class Recorder:
+    """Runs functions, timing them and measuring their peak memory, and collects the results"""
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.results = []
+
+    def run(self, group, function, nodes, edges, params, *args, **kwargs):
+        """Runs function(*args, **kwargs) and returns its result, or None if it failed or any argument is None"""
+        name = function.__name__
+        record = {'group': group, 'function': name, 'nodes': nodes, 'edges': edges, 'params': params}
+        self.results.append(record)
+        if any(arg is None for arg in args) or any(arg is None for arg in kwargs.values()):
+            record['status'] = 'skipped'
+            return None
+        try:
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            record['seconds'] = time.perf_counter() - start
+            if self.memory:
+                tracemalloc.start()
+                function(*args, **kwargs)
+                record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+        except Exception as error:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            record['status'] = 'error'
+            record['error'] = '%s: %s' % (type(error).__name__, error)
+            print('%-28s %10d %s' % (name, nodes or 0, record['error']), file=sys.stderr)
+            return None
+        record['status'] = 'ok'
+        memory = '%10.1f MB' % record['peak_mb'] if 'peak_mb' in record else ''
+        print('%-28s %10d %10.3f s %s' % (name, nodes or 0, record['seconds'], memory), file=sys.stderr)
+        return result
+
+
+def bench_graph(recorder, n, args):
+    graph = scale_free_graph(n, seed=args.seed)
+    edges = len(graph.indices)
+    vocabulary, categories = category_table(max(1000, n // 10), seed=args.seed)
+    cats = category_dict(graph, categories, seed=args.seed)
+    embeddings = random_embeddings(vocabulary, seed=args.seed)
+    k, dim = args.clusters, args.dim
+    run = lambda function, params, *a, **kw: recorder.run('ProjectAlgorithm', function, n, edges, params, *a, **kw)
+
+    A = run(pa.adjacency_matrix, {}, graph)
+    run(pa.normalized_adjacency, {'tau': 'mean degree'}, A, A.sum() / n if A is not None else None)
+    points = None
+    for method in args.eigen_methods:
+        evecs = run(pa.project_graph, {'dim': dim, 'method': method}, graph, dim, method, seed=args.seed)
+        points = evecs if points is None else points
+    if points is not None:
+        points = np.ascontiguousarray(points)
+
+    run(pa.streaming_kmeans, {'num_clusters': k}, points, k, seed=args.seed)
+    labels = centers = None
+    for method in ['kmeans', 'minibatch'] if n <= args.kmeans_limit else ['minibatch']:
+        found = run(pa.find_clusters, {'num_clusters': k, 'method': method}, points, graph, cats, k, method,
+                    seed=args.seed)
+        if found is not None:
+            labels, centers = found
+    run(pa.cluster_medoids, {'num_clusters': k}, points, labels, k)
+
+    clusters = run(pa.get_clusters, {'num_clusters': k}, graph.nodes, labels)
+    run(pa.cluster_labels, {'num_clusters': k}, graph.nodes, clusters)
+    run(pa.get_cluster_categories, {'num_clusters': k}, clusters, cats)
+    run(pa.count_cluster_categories, {'num_clusters': k}, clusters, cats)
+    counted = run(pa.count_cluster_tokens, {'num_clusters': k}, clusters, cats, centers)
+    token_vocabulary, token_counts = counted if counted is not None else (None, None)
+    run(pa.top_counts, {'num_clusters': k, 'n': 10}, token_counts, 10, token_vocabulary)
+    run(pa.get_cluster_names, {'num_clusters': k, 'embedding_dim': embeddings.vector_size}, clusters, {}, centers,
+        token_counts, token_vocabulary, embeddings)
+
+    run(pa.cluster_adjacency, {'num_clusters': k}, A, labels, k)
+    C = run(pa.make_cluster_graph, {'num_clusters': k}, graph, clusters)
+    run(pa.cluster_graph_dict, {'num_clusters': k}, C)
+    return graph, categories
+
+
+def bench_scraper(recorder, graph, categories, args):
+    """Times the parse helpers on synthetic pages of the crawled nodes of graph"""
+    rng = np.random.default_rng(args.seed)
+    nodes = rng.choice(graph.num_keys, min(args.pages, graph.num_keys), replace=False)
+    # go_to_section parses each section again without naming a parser
+    warnings.simplefilter('ignore', GuessedAtParserWarning)
+    pages = [page_html(graph, i, rng.choice(categories, 7)) for i in nodes]
+    soups = [BeautifulSoup(html, 'lxml') for html in pages]
+    params = {'pages': len(pages), 'mean_bytes': int(np.mean([len(html) for html in pages]))}
+    run = lambda function, *a: recorder.run('WikiScraper', function, None, None, params, *a)
+
+    def each(function, inputs, name=None):
+        def each(items):
+            return [function(item) for item in items]
+        each.__name__ = name or function.__name__
+        return run(each, inputs)
+
+    infos = each(ws.extract_page, pages)
+    each(lambda html: BeautifulSoup(html, 'lxml'), pages, 'BeautifulSoup')
+    each(ws.find_sections, soups)
+    each(lambda soup: ws.go_to_section(soup, 'See also'), soups, 'go_to_section')
+    each(ws.extract_see_also, soups)
+    each(ws.find_see_also_notes, soups)
+    each(ws.get_cat_titles, soups)
+    each(ws.extract_title, soups)
+    links = [link for info in infos or [] for _, link in info.see_also + info.see_also_notes]
+    each(ws.normalize_link, links)
+
+    def add_pages(infos):
+        dictionaries = [dict(), dict(), dict()]
+        for info in infos:
+            ws.add_page(info, '', dictionaries)
+        return dictionaries
+    run(add_pages, infos)
+
+
+def metadata(args):
+    def git(*command):
+        try:
+            return subprocess.run(['git'] + list(command), cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return None
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'memory_gb': os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**30,
+        'args': vars(args),
+    }
+
+
+def compare(old_path, new_path):
+    """Prints the ratio of the time and peak memory of every function run by both old and new"""
+    def load(path):
+        with open(path) as f:
+            run = json.load(f)
+        key = lambda r: (r['function'], r['nodes'] or 0, json.dumps(r['params'], sort_keys=True))
+        return run['meta'], {key(r): r for r in run['results'] if r.get('status') == 'ok'}
+    (old_meta, old), (new_meta, new) = load(old_path), load(new_path)
+    print('old %s, new %s' % ((old_meta['commit'] or '?')[:10], (new_meta['commit'] or '?')[:10]))
+    print('%-28s %10s %-36s %10s %10s %8s %8s' % ('function', 'nodes', 'params', 'old s', 'new s', 'time', 'memory'))
+    for key in sorted(set(old) & set(new)):
+        o, n = old[key], new[key]
+        memory = '%7.2fx' % (n['peak_mb'] / o['peak_mb']) if o.get('peak_mb') and n.get('peak_mb') else '-'
+        print('%-28s %10d %-36s %10.3f %10.3f %7.2fx %8s' % (key[0], key[1], key[2][:36], o['seconds'],
+                                                             n['seconds'], n['seconds'] / o['seconds'], memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on synthetic scale-free graphs')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10**4, 10**5, 10**6, 10**7])
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--dim', type=int, default=10)
+    parser.add_argument('--eigen-methods', nargs='+', default=['eigsh', 'randomized'],
+                        choices=['eigsh', 'lobpcg', 'randomized'])
+    parser.add_argument('--kmeans-limit', type=int, default=10**5, help='largest size to run full-batch KMeans on')
+    parser.add_argument('--pages', type=int, default=200, help='the number of synthetic pages to parse')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc runs')
+    parser.add_argument('--out', help='the json file to write; defaults to bench_pipeline_<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    meta = metadata(args)
+    out = args.out or 'bench_pipeline_%s.json' % (meta['commit'] or 'unknown')[:10]
+    recorder = Recorder(args.memory)
+    for i, n in enumerate(sorted(args.sizes)):
+        graph, categories = bench_graph(recorder, n, args)
+        if i == 0:
+            bench_scraper(recorder, graph, categories, args)
+        del graph
+        with open(out, 'w') as f:
+            json.dump({'meta': meta, 'results': recorder.results}, f, indent=1)
+    print('Results in %s' % out, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
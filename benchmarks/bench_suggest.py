@@ -0,0 +1,58 @@
+"""Microbenchmark of the autocomplete index behind /suggest, on a synthetic list of subjects.
+
+Subjects are made of two to four words drawn from a vocabulary with a Zipf-like distribution, like cluster and topic
+names. Queries are prefixes of random subjects, and the same prefixes with two letters swapped, which fall through
+to the trigram fuzzy match.
+
+Usage: python benchmarks/bench_suggest.py [num_subjects ...]
+"""
+import os
+import sys
+import time
+import random
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'App'))
+from suggest import SuggestIndex
+
+
+def make_subjects(n, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(max(1000, n // 20))]
+    cum_weights = list(itertools.accumulate(1 / (r + 1) for r in range(len(vocabulary))))
+    subjects = set()
+    while len(subjects) < n:
+        subjects.add(' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 4))))
+    return sorted(subjects)
+
+
+def typo(text, rng):
+    if len(text) < 4:
+        return text
+    i = rng.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def bench(index, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.suggest(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return 1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000, 300000]
+    rng = random.Random(0)
+    for n in sizes:
+        subjects = make_subjects(n, rng)
+        start = time.perf_counter()
+        index = SuggestIndex(subjects)
+        build = time.perf_counter() - start
+        prefixes = [subject[:rng.randint(1, len(subject))] for subject in rng.sample(subjects, 1000)]
+        p50, p99 = bench(index, prefixes)
+        f50, f99 = bench(index, [typo(prefix, rng) for prefix in prefixes])
+        print('%8d subjects  build %6.2f s  prefix p50 %6.3f ms p99 %6.3f ms  typo p50 %6.3f ms p99 %6.3f ms'
+              % (n, build, p50, p99, f50, f99))
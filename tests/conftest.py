@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The crawler and analysis modules live at the top of the repository, and the App imports its modules by their names
+for path in (ROOT, os.path.join(ROOT, 'App')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
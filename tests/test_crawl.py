@@ -0,0 +1,139 @@
+"""The crawls, run against a local stand-in for Wikipedia serving a small graph of saved pages"""
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import WikiScraper
+from PageStore import PageStore
+
+# Page i links to pages 2i + 1 and 2i + 2 in its "See also" section, so the crawl from Page_0 is a binary tree; the
+# leaves link back to Page_0, and Page_5 redirects to Page_6
+NUM_PAGES = 15
+REDIRECTS = {'Page_5': 'Page_6'}
+
+
+def see_also(i):
+    children = [j for j in (2 * i + 1, 2 * i + 2) if j < NUM_PAGES]
+    return children or [0]
+
+
+def page_html(i):
+    title = 'Page %d' % i
+    links = ''.join('<li><a href="/wiki/Page_%d" title="Page %d">Page %d</a></li>' % (j, j, j) for j in see_also(i))
+    cats = ''.join('<li><a href="/wiki/Category:Level_%d">Level %d</a></li>' % (k, k) for k in (i.bit_length(), 99))
+    return ('<html><head><title>%s - Wikipedia</title></head><body><div id="content">'
+            '<h2>History</h2><p>About %s.</p><h2>See also</h2><ul>%s</ul><h2>References</h2>'
+            '<div id="catlinks"><div id="mw-normal-catlinks"><a href="/wiki/Help:Category">Categories</a>'
+            '<ul>%s</ul></div></div></div></body></html>' % (title, title, links, cats))
+
+
+class WikiHandler(BaseHTTPRequestHandler):
+    pages = {'Page_%d' % i: page_html(i) for i in range(NUM_PAGES)}
+
+    def do_GET(self):
+        self.server.requests[self.path] += 1
+        name = self.path[len('/wiki/'):] if self.path.startswith('/wiki/') else None
+        if name in REDIRECTS:
+            self.send_response(301)
+            self.send_header('Location', '/wiki/' + REDIRECTS[name])
+            self.end_headers()
+            return
+        if name not in self.pages:
+            self.send_error(404)
+            return
+        body = self.pages[name].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), WikiHandler)
+    httpd.requests = Counter()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base_url = 'http://127.0.0.1:%d/' % httpd.server_address[1]
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def crawl(function, server, depth=10, **kwargs):
+    dictionaries = [dict(), dict(), dict()]
+    function('wiki/Page_0', dictionaries, depth, base_url=server.base_url, **kwargs)
+    return dictionaries
+
+
+def test_bfs_search(server):
+    graph_dict, text_to_link_dict, category_dict = crawl(WikiScraper.bfs_search, server)
+    # Page 5 is only reached through its redirect to Page 6, which is visited once, so neither it nor its children
+    # 11 and 12 are crawled
+    assert set(graph_dict) == {'Page %d' % i for i in range(NUM_PAGES) if i not in (5, 11, 12)}
+    assert graph_dict['Page 1'] == ['Page 3', 'Page 4']
+    assert graph_dict['Page 14'] == ['Page 0']
+    assert category_dict['Page 3'] == ['Level 2', 'Level 99']
+    assert text_to_link_dict['Page 3'] == '/wiki/Page_3'
+
+
+def test_crawl_modes_agree(server):
+    expected = crawl(WikiScraper.bfs_search, server)
+    assert crawl(WikiScraper.concurrent_bfs_search, server, concurrency=4) == expected
+    assert crawl(WikiScraper.sharded_bfs_search, server, processes=2, concurrency=4) == expected
+
+
+def test_depth(server):
+    graph_dict = crawl(WikiScraper.bfs_search, server, depth=1)[0]
+    assert set(graph_dict) == {'Page 0', 'Page 1', 'Page 2'}
+
+
+def test_offline_replay(server, tmp_path):
+    store = PageStore(str(tmp_path / 'pages.db'))
+    expected = crawl(WikiScraper.bfs_search, server, store=store)
+    fetched = sum(server.requests.values())
+    assert crawl(WikiScraper.bfs_search, server, store=store, offline=True)[0] == expected[0]
+    assert sum(server.requests.values()) == fetched
+
+
+@pytest.mark.parametrize('function, kwargs', [(WikiScraper.bfs_search, {}),
+                                              (WikiScraper.concurrent_bfs_search, {'concurrency': 4}),
+                                              (WikiScraper.sharded_bfs_search, {'processes': 2, 'concurrency': 4})])
+def test_incremental_only_fetches_new_pages(server, function, kwargs):
+    dictionaries = crawl(function, server, depth=2, **kwargs)
+    server.requests.clear()
+    function('wiki/Page_0', dictionaries, 3, base_url=server.base_url, incremental=True, **kwargs)
+    fetched = set(server.requests)
+    assert dictionaries == crawl(WikiScraper.bfs_search, server, depth=3)
+    # Only depth 3, pages 7 to 14 less the children of the redirected Page 5, is new; the link to Page 5 is not that
+    # of any page of the earlier crawl, so the redirect is followed again
+    assert fetched == {'/wiki/Page_%d' % i for i in range(5, NUM_PAGES) if i not in (11, 12)}
+
+
+@pytest.mark.parametrize('function, kwargs', [(WikiScraper.bfs_search, {}),
+                                              (WikiScraper.concurrent_bfs_search, {'concurrency': 2}),
+                                              (WikiScraper.sharded_bfs_search, {'processes': 2, 'concurrency': 2,
+                                                                                'batch_size': 2})])
+def test_resume_from_checkpoint(server, tmp_path, monkeypatch, function, kwargs):
+    expected = crawl(WikiScraper.bfs_search, server)
+    checkpoint = str(tmp_path / 'crawl.json')
+
+    class Interrupted(Exception):
+        pass
+
+    save_checkpoint = WikiScraper.save_checkpoint
+    def interrupt(*args):
+        save_checkpoint(*args)
+        raise Interrupted
+    monkeypatch.setattr(WikiScraper, 'save_checkpoint', interrupt)
+    with pytest.raises(Interrupted):
+        crawl(function, server, checkpoint=checkpoint, checkpoint_every=4, **kwargs)
+    monkeypatch.setattr(WikiScraper, 'save_checkpoint', save_checkpoint)
+
+    assert WikiScraper.resume_bfs_search(checkpoint, checkpoint_every=4) == expected
@@ -0,0 +1,69 @@
+"""The live recommendation jobs, queued and run by a burst worker on fakeredis"""
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+from rq import Queue, SimpleWorker
+
+import tasks
+from jobs import ResultCache, enqueue_recommendation, job_status, job_id, LOCK_PREFIX
+
+
+class FakeRecommender:
+    def __init__(self):
+        self.subjects = []
+
+    def recommend(self, subject):
+        self.subjects.append(subject)
+        return [[subject.title(), '/wiki/' + subject.title().replace(' ', '_')]]
+
+
+@pytest.fixture
+def conn():
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def queue(conn):
+    return Queue('default', connection=conn)
+
+
+@pytest.fixture
+def recommender(monkeypatch):
+    recommender = FakeRecommender()
+    monkeypatch.setattr(tasks, '_recommender', recommender)
+    return recommender
+
+
+def work(queue):
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+
+def test_same_query_is_enqueued_once(queue):
+    subjects = ('Machine learning', 'machine  LEARNING', 'Machine learning ')
+    keys = {enqueue_recommendation(queue, subject) for subject in subjects}
+    assert keys == {job_id('machine learning')}
+    assert queue.count == 1
+    assert job_status(queue, keys.pop()) == 'queued'
+
+
+def test_burst_run(queue, recommender):
+    key = enqueue_recommendation(queue, 'Machine learning')
+    work(queue)
+
+    assert recommender.subjects == ['Machine learning']
+    assert job_status(queue, key) == 'finished'
+    assert ResultCache(queue.connection).get('machine learning') == [['Machine Learning', '/wiki/Machine_Learning']]
+    assert not queue.connection.exists(LOCK_PREFIX + key)
+
+
+def test_finished_query_is_enqueued_again(queue, recommender):
+    enqueue_recommendation(queue, 'Graph theory')
+    work(queue)
+    enqueue_recommendation(queue, 'graph theory')
+    assert queue.count == 1
+    work(queue)
+    assert recommender.subjects == ['Graph theory', 'graph theory']
+
+
+def test_unknown_job(queue):
+    assert job_status(queue, job_id('Never asked')) is None